@@ -1,4 +1,4 @@
-from .concrete_factories import *  # noqa: F401, F403
+from . import concrete_factories  # noqa: F401, registers the connectors
 from .manager import FactoryManager  # noqa: F401
 
 available_connectors = list(FactoryManager._mapping.keys())
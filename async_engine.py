@@ -0,0 +1,105 @@
+"""asyncio execution path for the concrete factories"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator
+from typing import Optional
+
+from .connector_factory import ConnectorFactory
+from .serialization import count_rows
+
+_lock = threading.Lock()
+_executor = None
+_done = object()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """shared pool running the blocking api calls of every async factory.
+
+    threads are only busy while a request is in flight, waits between
+    pages are awaited on the event loop.
+    size is read from ASYNC_IO_WORKERS (default 32)
+    """
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("ASYNC_IO_WORKERS", 32)),
+                    thread_name_prefix="connector-io",
+                )
+    return _executor
+
+
+class AsyncConnector:
+    """awaitable wrapper around a concrete factory.
+
+    the factory is built with deferred=True, so nothing runs on __init__,
+    set_up, every page fetch and every send are awaited instead.
+
+    usage:
+        factory = get_factory(alias, asynchronous=True)
+        await factory(credential, date_range).extract()
+    """
+
+    def __init__(
+        self,
+        factory_class,
+        credential,
+        date_range,
+        executor: Optional[ThreadPoolExecutor] = None,
+        **kwargs,
+    ) -> None:
+        kwargs["deferred"] = True
+        self.factory: ConnectorFactory = factory_class(
+            credential, date_range, **kwargs
+        )
+        self.executor = executor or get_executor()
+
+    async def _call(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, partial(function, *args)
+        )
+
+    async def set_up(self) -> None:
+        with self.factory.timer("set_up"):
+            await self._call(self.factory.set_up)
+
+    async def fetch(self) -> AsyncIterator[dict]:
+        """awaitable version of factory.fetch_pages"""
+        if not self.factory.enabled:
+            return
+        pages = self.factory.fetch_pages()
+        while True:
+            if not self.factory.serving_cache:
+                with self.factory.timer("wait"):
+                    await asyncio.sleep(self.factory.throttle())
+            page = await self._call(next, pages, _done)
+            if page is _done:
+                break
+            self.factory.count("rows", count_rows(page))
+            yield page
+
+    async def send(self, payload: dict) -> bool:
+        return await self._call(self.factory.deliver, payload)
+
+    async def flush(self) -> bool:
+        return await self._call(self.factory.flush)
+
+    async def extract(self) -> bool:
+        """set_up, fetch and send every page
+        :return: bool if every page was delivered and no window failed
+        """
+        if not self.factory.enabled:
+            return False
+        await self.set_up()
+
+        all_ok = True
+        async for page in self.fetch():
+            if not await self.send(page) and page.get("data"):
+                all_ok = False
+        flushed = await self.flush()
+        return flushed and all_ok and not self.factory.failed_windows
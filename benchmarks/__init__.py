@@ -0,0 +1,5 @@
+"""offline throughput benchmarks of the connectors.
+
+every api is replaced by a local fake server (see fakes), run with:
+    python -m <package>.benchmarks --help
+"""
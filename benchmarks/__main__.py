@@ -0,0 +1,204 @@
+"""run the connectors against the fake apis and report rows/sec,
+latency percentiles and peak memory"""
+import argparse
+import logging
+import os
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import requests
+
+from ..metrics import HistogramBackend
+from ..metrics import set_instrumentation
+from ..session import reset_session
+from .fakes import FakeDataBridge
+from .fakes import FakeGoogleAnalytics
+from .fakes import FakeShopify
+
+DATE_RANGE = [{"from": "2020-04-01", "to": "2020-04-30"}]
+
+
+def shopify_factory(fake: FakeShopify, tenant: int, options: dict):
+    """ShopifyFactory of a synthetic tenant, the metadata lookup is
+    skipped and the store is the fake one"""
+    from ..concrete_factories.shopify_api import ShopifyFactory
+
+    class FakeStoreFactory(ShopifyFactory):
+        def load_token(self) -> dict:
+            return {
+                "store_name": f"store-{tenant}",
+                "password": "benchmark",
+                "api_key": "benchmark",
+            }
+
+        def store_url(self) -> str:
+            return f"{fake.url}/admin/api/{self.API_VERSION}"
+
+    credential = SimpleNamespace(
+        id=None,
+        uri=None,
+        platform="shopify",
+        company_id=f"tenant-{tenant}",
+        metadata={},
+        rfc=None,
+    )
+    return FakeStoreFactory(
+        credential, DATE_RANGE, **{**options, "deferred": True}
+    )
+
+
+class FakeQuery:
+    """stands for a googleapiclient HttpRequest of data().ga().get()"""
+
+    def __init__(self, uri: str) -> None:
+        self.uri = uri
+
+    def execute(self) -> dict:
+        return requests.get(self.uri, timeout=30).json()
+
+
+def google_analytics_factory(fake, tenant: int, options: dict):
+    """GoogleUniversalFactory of a synthetic tenant with a single
+    profile, queries are answered by the fake Core Reporting server"""
+    from ..concrete_factories.google_analytics import GoogleUniversalFactory
+
+    url = f"{fake.url}/analytics/v3/data/ga"
+
+    class FakeReportingFactory(GoogleUniversalFactory):
+        def set_up(self) -> None:
+            self.profiles = [str(tenant)]
+
+        def query_to_extract_data(self, *args, **kwargs):
+            return FakeQuery(f"{url}?max-results={self.MAX_RESULTS}")
+
+    metadata = dict.fromkeys(
+        (
+            "token",
+            "scopes",
+            "client_id",
+            "token_uri",
+            "client_secret",
+            "refresh_token",
+        )
+    )
+    credential = SimpleNamespace(
+        id=None,
+        platform="google-analytics",
+        company_id=f"tenant-{tenant}",
+        metadata={**metadata, "accounts": [], "engine": "v3"},
+    )
+    return FakeReportingFactory(
+        credential, DATE_RANGE, **{**options, "deferred": True}
+    )
+
+
+def run(name: str, factories, bridge: FakeDataBridge, memory: bool):
+    backend = HistogramBackend()
+    set_instrumentation(backend)
+    requests_before = bridge.stats["requests"]
+    bytes_before = bridge.stats["bytes"]
+
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    for factory in factories:
+        factory.set_up()
+        factory.extract()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if memory else None
+    if memory:
+        tracemalloc.stop()
+
+    snapshot = backend.snapshot()
+    rows = sum(
+        c["value"] for c in snapshot["counters"] if c["name"] == "rows"
+    )
+    report = SimpleNamespace(
+        name=name,
+        rows=rows,
+        seconds=elapsed,
+        rows_per_second=rows / elapsed if elapsed else 0,
+        requests=bridge.stats["requests"] - requests_before,
+        bytes=bridge.stats["bytes"] - bytes_before,
+        peak=peak,
+        phases={},
+    )
+    for h in snapshot["histograms"]:
+        phase = report.phases.setdefault(h["name"], [])
+        phase.append(h)
+    print_report(report)
+    return report
+
+
+def print_report(report) -> None:
+    print(f"\n== {report.name}")
+    print(
+        f"rows: {report.rows}  time: {report.seconds:.2f}s  "
+        f"rows/sec: {report.rows_per_second:,.0f}"
+    )
+    print(f"data bridge: {report.requests} requests, {report.bytes:,} bytes")
+    if report.peak is not None:
+        print(f"peak memory: {report.peak / 1024 / 1024:.1f} MiB")
+    for phase, histograms in sorted(report.phases.items()):
+        count = sum(h["count"] for h in histograms)
+        p50 = max(h["p50"] for h in histograms) * 1000
+        p90 = max(h["p90"] for h in histograms) * 1000
+        p99 = max(h["p99"] for h in histograms) * 1000
+        print(
+            f"  {phase:<10} n={count:<6} p50<={p50:.2f}ms "
+            f"p90<={p90:.2f}ms p99<={p99:.2f}ms"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tenants", type=int, default=3)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--ga-rows", type=int, default=20000)
+    parser.add_argument("--batch", action="store_true")
+    parser.add_argument("--compact", action="store_true")
+    parser.add_argument("--columnar", action="store_true")
+    parser.add_argument(
+        "--prefetch", type=int, default=0, help="pages fetched ahead"
+    )
+    parser.add_argument(
+        "--memory", action="store_true", help="trace peak memory (slower)"
+    )
+    parser.add_argument(
+        "--only", choices=("shopify", "google-analytics"), default=None
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    options = {"batch": args.batch, "prefetch": args.prefetch}
+    with FakeDataBridge() as bridge:
+        os.environ["CM_URL"] = bridge.url
+        reset_session()
+
+        if args.only in (None, "shopify"):
+            with FakeShopify(orders=args.orders) as fake:
+                factories = [
+                    shopify_factory(
+                        fake, tenant, {**options, "compact": args.compact}
+                    )
+                    for tenant in range(args.tenants)
+                ]
+                run("shopify", factories, bridge, args.memory)
+
+        if args.only in (None, "google-analytics"):
+            ga_options = {
+                **options,
+                "output_format": "columnar" if args.columnar else "rows",
+            }
+            with FakeGoogleAnalytics(rows=args.ga_rows) as fake:
+                factories = [
+                    google_analytics_factory(fake, tenant, ga_options)
+                    for tenant in range(args.tenants)
+                ]
+                run("google-analytics", factories, bridge, args.memory)
+        reset_session()
+
+
+if __name__ == "__main__":
+    main()
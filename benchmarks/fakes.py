@@ -0,0 +1,193 @@
+"""local stand-ins of the apis used by the connectors, no network needed"""
+import gzip
+import json
+import threading
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+
+class FakeServer:
+    """runs a handler class on 127.0.0.1 in a background thread"""
+
+    handler = None
+
+    def __init__(self, **config) -> None:
+        handler = type(
+            self.handler.__name__, (self.handler,), {"config": config}
+        )
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "FakeServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    config = {}
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def reply(self, body: dict, headers: dict = None) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def synthetic_order(i: int) -> dict:
+    return {
+        "id": 1000000 + i,
+        "name": f"#{i}",
+        "email": f"customer{i}@example.com",
+        "created_at": "2020-04-01T12:00:00-05:00",
+        "currency": "USD",
+        "total_price": f"{i % 500}.99",
+        "financial_status": "paid",
+        "line_items": [
+            {"id": i * 10 + j, "sku": f"SKU-{j}", "quantity": 1, "price": "9"}
+            for j in range(3)
+        ],
+        "shipping_address": {"city": "Mexico", "country_code": "MX"},
+    }
+
+
+class _ShopifyHandler(_Handler):
+    """GET /admin/api/<version>/orders.json with cursor pagination
+    (Link header, page_info) and the call limit header"""
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        orders = self.config.get("orders", 1000)
+        limit = int(query.get("limit", ["250"])[0])
+        start = int(query.get("page_info", ["0"])[0])
+        end = min(orders, start + limit)
+
+        headers = {"X-Shopify-Shop-Api-Call-Limit": "1/40"}
+        if end < orders:
+            headers["Link"] = (
+                f'<http://{self.headers["Host"]}{url.path}'
+                f'?limit={limit}&page_info={end}>; rel="next"'
+            )
+        body = {"orders": [synthetic_order(i) for i in range(start, end)]}
+        self.reply(body, headers)
+
+
+class FakeShopify(FakeServer):
+    """config: orders, total orders of the store"""
+
+    handler = _ShopifyHandler
+
+
+class _GoogleAnalyticsHandler(_Handler):
+    """GET /analytics/v3/data/ga Core Reporting v3 responses,
+    max_results rows per page and a nextLink to the next one"""
+
+    HEADERS = [
+        ("ga:date", "DIMENSION", "STRING"),
+        ("ga:source", "DIMENSION", "STRING"),
+        ("ga:deviceCategory", "DIMENSION", "STRING"),
+        ("ga:sessions", "METRIC", "INTEGER"),
+        ("ga:pageviews", "METRIC", "INTEGER"),
+        ("ga:sessionDuration", "METRIC", "TIME"),
+    ]
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        total = self.config.get("rows", 10000)
+        max_results = int(query.get("max-results", ["1000"])[0])
+        start = int(query.get("start-index", ["1"])[0])
+        end = min(total + 1, start + max_results)
+
+        rows = [
+            [
+                "20200401",
+                f"source{i % 20}",
+                "desktop",
+                str(i % 50),
+                str(i % 90),
+                f"{i % 300}.0",
+            ]
+            for i in range(start, end)
+        ]
+        body = {
+            "kind": "analytics#gaData",
+            "totalResults": total,
+            "containsSampledData": False,
+            "columnHeaders": [
+                {"name": n, "columnType": c, "dataType": d}
+                for n, c, d in self.HEADERS
+            ],
+            "rows": rows,
+        }
+        if end <= total:
+            body["nextLink"] = (
+                f"http://{self.headers['Host']}{url.path}"
+                f"?max-results={max_results}&start-index={end}"
+            )
+        self.reply(body)
+
+
+class FakeGoogleAnalytics(FakeServer):
+    """config: rows, total rows of the report"""
+
+    handler = _GoogleAnalyticsHandler
+
+
+class _DataBridgeHandler(_Handler):
+    """POST of single or batched payloads, always successful"""
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        encoding = self.headers.get("Content-Encoding")
+        if encoding == "gzip":
+            body = gzip.decompress(body)
+        elif encoding == "zstd" and zstandard is not None:
+            body = zstandard.ZstdDecompressor().decompress(body)
+        payload = json.loads(body)
+
+        stats = self.config["stats"]
+        with stats["lock"]:
+            stats["requests"] += 1
+            stats["bytes"] += length
+        if "batch" in payload:
+            results = [{"status": "Success"} for _ in payload["batch"]]
+            self.reply({"status": "Success", "results": results})
+        else:
+            self.reply({"status": "Success"})
+
+
+class FakeDataBridge(FakeServer):
+    handler = _DataBridgeHandler
+
+    def __init__(self) -> None:
+        self.stats = {"lock": threading.Lock(), "requests": 0, "bytes": 0}
+        super().__init__(stats=self.stats)
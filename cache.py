@@ -0,0 +1,244 @@
+"""small on-disk json caches shared by processes of the same host"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Any
+from typing import Iterator
+from typing import Optional
+
+from .serialization import dumps
+
+_missing = object()
+
+
+def cache_root(directory: Optional[str] = None) -> str:
+    return directory or os.getenv(
+        "CONNECTOR_CACHE_DIR",
+        os.path.join(tempfile.gettempdir(), "connector-cache"),
+    )
+
+
+class DiskCache:
+    """json values stored one file per key inside a directory.
+
+    entries older than ttl seconds are ignored and removed when read,
+    when there are more than max_entries files the least recently
+    written ones are evicted.
+    writes go through a temporary file + rename, so concurrent jobs
+    never read half written entries.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl: float = 24 * 60 * 60,
+        max_entries: int = 10000,
+        directory: Optional[str] = None,
+    ) -> None:
+        """
+        :param namespace: sub directory of the cache, e.g. "ga-profiles"
+        :param ttl: seconds an entry is valid
+        :param max_entries: files kept before evicting the oldest
+        :param directory: root of every namespace, CONNECTOR_CACHE_DIR
+            environment variable or the temp dir by default
+        """
+        self.directory = os.path.join(cache_root(directory), namespace)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                self._remove(path)
+                return default
+            with open(path) as file_:
+                return json.load(file_)
+        except (OSError, ValueError):
+            return default
+
+    def set(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as file_:
+                json.dump(value, file_)
+            os.replace(tmp, path)
+        except OSError as e:
+            logging.warning(f"could not write cache entry {path}: {e}")
+            return
+        self.evict()
+
+    def get_or_set(self, key: str, function) -> Any:
+        """cached value of key, computed by function() when missing"""
+        value = self.get(key, _missing)
+        if value is _missing:
+            value = function()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """remove an entry, or every entry of the namespace if key is None"""
+        if key is not None:
+            self._remove(self._path(key))
+            return
+        for name in os.listdir(self.directory):
+            self._remove(os.path.join(self.directory, name))
+
+    def evict(self) -> None:
+        """drop expired entries and the oldest ones above max_entries"""
+        entries = []
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            try:
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            if now - mtime > self.ttl:
+                self._remove(entry.path)
+            else:
+                entries.append((mtime, entry.path))
+
+        if len(entries) > self.max_entries:
+            entries.sort()
+            for _, path in entries[: len(entries) - self.max_entries]:
+                self._remove(path)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class PageCache:
+    """pages of api results stored per window, for windows that can't
+    change anymore (e.g. GA days past the processing latency).
+
+    keys are content addressed: the hash of everything that defines the
+    result (connector, account, query parameters, window). every window
+    is a gzip file of json lines, one page per line, written through a
+    temporary file so only complete windows are ever served. files are
+    touched when read and the least recently used ones are evicted above
+    max_bytes.
+    """
+
+    SUFFIX = ".jsonl.gz"
+
+    def __init__(
+        self,
+        namespace: str = "pages",
+        max_bytes: int = 1024 * 1024 * 1024,
+        directory: Optional[str] = None,
+    ) -> None:
+        """
+        :param namespace: sub directory of the cache
+        :param max_bytes: compressed bytes kept before evicting
+        :param directory: root of every namespace, CONNECTOR_CACHE_DIR
+            environment variable or the temp dir by default
+        """
+        self.directory = os.path.join(cache_root(directory), namespace)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(**parts) -> str:
+        """digest of the parts of a query, their order doesn't matter"""
+        body = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def get(self, key: str) -> Optional[Iterator]:
+        """
+        :return: iterator of the pages of key, None if not cached
+        """
+        path = self._path(key)
+        try:
+            file_ = gzip.open(path, "rb")
+            os.utime(path)
+        except OSError:
+            return None
+        return self._read(file_)
+
+    @staticmethod
+    def _read(file_) -> Iterator:
+        with file_:
+            for line in file_:
+                yield json.loads(line)
+
+    def writer(self, key: str) -> "PageWriter":
+        return PageWriter(self, key)
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """remove a window, or every window if key is None"""
+        if key is not None:
+            DiskCache._remove(self._path(key))
+            return
+        for name in os.listdir(self.directory):
+            DiskCache._remove(os.path.join(self.directory, name))
+
+    def evict(self) -> None:
+        """drop the least recently used windows above max_bytes"""
+        entries, total = [], 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(self.SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            DiskCache._remove(path)
+            total -= size
+
+
+class PageWriter:
+    """context manager storing the pages of a window, committed on a
+    clean exit and discarded if an error (or GeneratorExit) is raised"""
+
+    def __init__(self, cache: PageCache, key: str) -> None:
+        self.cache = cache
+        self.key = key
+        self._file = None
+        self._tmp = None
+
+    def __enter__(self) -> "PageWriter":
+        fd, self._tmp = tempfile.mkstemp(
+            dir=self.cache.directory, suffix=".tmp"
+        )
+        os.close(fd)
+        self._file = gzip.open(self._tmp, "wb", compresslevel=6)
+        return self
+
+    def append(self, page) -> None:
+        self._file.write(dumps(page) + b"\n")
+
+    def __exit__(self, error_type, error, traceback) -> None:
+        try:
+            self._file.close()
+            if error_type is None:
+                os.replace(self._tmp, self.cache._path(self.key))
+        except OSError as e:
+            logging.warning(f"could not write cache window {self.key}: {e}")
+        finally:
+            DiskCache._remove(self._tmp)
+        if error_type is None:
+            self.cache.evict()
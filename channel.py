@@ -0,0 +1,80 @@
+"""bounded hand-off of pages between a producer thread and a consumer"""
+import threading
+from queue import Empty
+from queue import Full
+from queue import Queue
+from typing import Iterable
+from typing import Iterator
+
+_end = object()
+
+
+class PageChannel:
+    """queue of at most maxsize items fed by a producer thread.
+
+    the producer blocks while the queue is full, so only maxsize items
+    are held in memory. errors raised by the producer are re-raised to
+    the consumer once the items before them have been consumed.
+    stop() releases a producer that nobody will consume anymore.
+
+    usage:
+        channel = PageChannel(4)
+        threading.Thread(target=channel.feed, args=(pages,)).start()
+        for page in channel:
+            ...
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self._queue = Queue(maxsize=max(1, maxsize))
+        self._stop = threading.Event()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop.is_set()
+
+    def put(self, item) -> bool:
+        """
+        :return: False if the channel was stopped before item fit in
+        """
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def feed(self, items: Iterable) -> None:
+        """put every item of items, then the end of the channel"""
+        if self._stop.is_set():
+            return
+        iterator = iter(items)
+        try:
+            for item in iterator:
+                if not self.put((item, None)):
+                    return
+        except Exception as e:
+            self.put((_end, e))
+        else:
+            self.put((_end, None))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    def __iter__(self) -> Iterator:
+        while True:
+            try:
+                item, error = self._queue.get(timeout=0.1)
+            except Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            if item is _end:
+                if error is not None:
+                    raise error
+                return
+            yield item
+
+    def stop(self) -> None:
+        self._stop.set()
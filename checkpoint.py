@@ -0,0 +1,116 @@
+"""resumable extraction cursors stored in a local sqlite database"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+class CheckpointStore:
+    """last page cursor and high-water mark per connector, scope
+    (store, profile...) and date window.
+
+    a window with a cursor was interrupted and resumes from it,
+    a done window is skipped on reruns, and the latest high-water mark
+    of a scope tells incremental runs where the last success ended.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS checkpoints (
+            connector TEXT NOT NULL,
+            scope TEXT NOT NULL,
+            window TEXT NOT NULL,
+            cursor TEXT,
+            high_water TEXT,
+            done INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (connector, scope, window)
+        )
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        """
+        :param path: sqlite file, CONNECTOR_CHECKPOINT_DB environment
+            variable or checkpoints.sqlite3 by default
+        """
+        self.path = path or os.getenv(
+            "CONNECTOR_CHECKPOINT_DB", "checkpoints.sqlite3"
+        )
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(self.SCHEMA)
+
+    @staticmethod
+    def window_key(window) -> str:
+        return json.dumps(window, sort_keys=True, default=str)
+
+    def get(self, connector: str, scope: str, window) -> Optional[dict]:
+        """state of a window: {cursor, high_water, done}, None if unknown"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT cursor, high_water, done FROM checkpoints "
+                "WHERE connector = ? AND scope = ? AND window = ?",
+                (connector, scope, self.window_key(window)),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"cursor": row[0], "high_water": row[1], "done": bool(row[2])}
+
+    def save_cursor(
+        self, connector: str, scope: str, window, cursor: Optional[str]
+    ) -> None:
+        """record the cursor of the next page to request"""
+        self._upsert(connector, scope, window, cursor, None, False)
+
+    def complete(
+        self, connector: str, scope: str, window, high_water: Optional[str]
+    ) -> None:
+        """mark a window as fully extracted"""
+        self._upsert(connector, scope, window, None, high_water, True)
+
+    def high_water(self, connector: str, scope: str) -> Optional[str]:
+        """latest high-water mark of the done windows of a scope"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT MAX(high_water) FROM checkpoints "
+                "WHERE connector = ? AND scope = ? AND done = 1",
+                (connector, scope),
+            ).fetchone()
+        return row[0] if row else None
+
+    def reset(self, connector: str, scope: Optional[str] = None) -> None:
+        """forget the checkpoints of a connector, or of one of its scopes"""
+        query = "DELETE FROM checkpoints WHERE connector = ?"
+        args = [connector]
+        if scope is not None:
+            query, args = query + " AND scope = ?", args + [scope]
+        with self._lock:
+            self._connection.execute(query, args)
+
+    def _upsert(self, connector, scope, window, cursor, high_water, done):
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO checkpoints "
+                "(connector, scope, window, cursor, high_water, done, "
+                "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (connector, scope, window) DO UPDATE SET "
+                "cursor = excluded.cursor, high_water = excluded.high_water, "
+                "done = excluded.done, updated_at = excluded.updated_at",
+                (
+                    connector,
+                    scope,
+                    self.window_key(window),
+                    cursor,
+                    high_water,
+                    int(done),
+                    time.time(),
+                ),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
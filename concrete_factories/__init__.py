@@ -1,9 +1,23 @@
-"""include all .py files in folder"""
+"""register all .py files in folder, without importing them.
+
+aliases are read from the mapping_alias decorators of every module,
+the module is only imported on the first get_factory of one of them.
+connectors outside this folder can be plugged in with the
+"factory_example.connectors" entry point group (name: alias,
+value: module[:class])"""
+import ast
 import glob
+import logging
+from importlib import metadata
 from os.path import basename
 from os.path import dirname
 from os.path import isfile
 from os.path import join
+from typing import List
+
+from ..decorators import _mapping
+
+ENTRY_POINT_GROUP = "factory_example.connectors"
 
 modules = glob.glob(join(dirname(__file__), "*.py"))
 __all__ = [
@@ -11,3 +25,43 @@ __all__ = [
     for f in modules
     if isfile(f) and not f.endswith("__init__.py")
 ]
+
+
+def declared_aliases(path: str) -> List[str]:
+    """aliases given to mapping_alias in a module, read with ast"""
+    with open(path) as file_:
+        tree = ast.parse(file_.read(), filename=path)
+
+    aliases = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.ClassDef):
+            continue
+        for decorator in node.decorator_list:
+            if (
+                isinstance(decorator, ast.Call)
+                and getattr(decorator.func, "id", None) == "mapping_alias"
+                and decorator.args
+            ):
+                value = ast.literal_eval(decorator.args[0])
+                aliases += [value] if isinstance(value, str) else value
+    return aliases
+
+
+def register_entry_points() -> None:
+    try:
+        entry_points = metadata.entry_points()
+        if hasattr(entry_points, "select"):
+            entry_points = entry_points.select(group=ENTRY_POINT_GROUP)
+        else:
+            entry_points = entry_points.get(ENTRY_POINT_GROUP, [])
+    except Exception as e:
+        logging.warning(f"could not read {ENTRY_POINT_GROUP}: {e}")
+        return
+    for entry_point in entry_points:
+        _mapping.register(entry_point.name, entry_point.value)
+
+
+for name in __all__:
+    for alias in declared_aliases(join(dirname(__file__), f"{name}.py")):
+        _mapping.register(alias, f"{__name__}.{name}")
+register_entry_points()
@@ -1,28 +1,94 @@
 """TODO
 https://developers.google.com/analytics/devguides/reporting/core/v3/errors"""
 import logging
+import threading
+from array import array
+from collections import defaultdict
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime as DaTe
+from datetime import timedelta
+from functools import partial
+from itertools import chain
 from typing import List
 from typing import Optional
 from typing import Tuple
 from typing import Union
 
+import requests
 from core.generic_credential import GenericCredential
 from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
 from googleapiclient.errors import HttpError
 
+try:
+    import numpy
+except ImportError:  # optional dependency, columnar output uses array
+    numpy = None
+
 from ...core.utils import parse_date_range
+from ..cache import DiskCache
+from ..channel import PageChannel
 from ..connector_factory import ConnectorFactory
+from ..connector_factory import deferred_checkpoints
+from ..connector_factory import write_checkpoints
 from ..decorators import mapping_alias
+from ..retry import get_policy
+from ..service_pool import get_service_pool
+
+
+class SharedCredentials(Credentials):
+    """credentials shared by the worker threads of a client. the pool
+    refreshes them before they expire and every service on a 401, so
+    refreshes are serialized and a thread waiting for another one to
+    refresh the token doesn't refresh it again"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._refresh_lock = threading.Lock()
+
+    def refresh(self, request) -> None:
+        token = self.token
+        with self._refresh_lock:
+            if self.token != token and self.valid:
+                return  # refreshed by another thread meanwhile
+            super().refresh(request)
 
 
 # noinspection PyMissingConstructor
 @mapping_alias("google-ads-universal")
 class GoogleUniversalFactory(ConnectorFactory):
     API_NAME, API_VERSION = "analytics", "v3"
+    # Analytics Reporting API v4, engine "v4"
+    REPORTING_API = "analyticsreporting", "v4"
+    ENGINES = ("v3", "v4")
     API_DATE_FORMAT = "%Y-%m-%d"
+    MAX_RESULTS = 1000
+    # rows per page of the Reporting API v4, 100000 at most
+    PAGE_SIZE = 100000
+    OUTPUT_FORMATS = ("rows", "columnar")
+    # columnHeaders dataType -> (numpy dtype, array typecode, parser)
+    COLUMN_TYPES = {
+        "INTEGER": ("int64", "q", int),
+        "FLOAT": ("float64", "d", float),
+        "CURRENCY": ("float64", "d", float),
+        "PERCENT": ("float64", "d", float),
+        "TIME": ("float64", "d", float),
+    }
+    DISCOVERY_URL = (
+        "https://www.googleapis.com/discovery/v1/apis/{api}/{version}/rest"
+    )
+    # seconds the discovery document and the profiles stay cached
+    DISCOVERY_TTL = 7 * 24 * 60 * 60
+    PROFILES_TTL = 24 * 60 * 60
+    # Core Reporting API: 10 concurrent requests per view (profile)
+    PROFILE_CONCURRENCY = 10
+    # pages a job running in a worker thread holds ahead of the consumer
+    JOB_PAGES = 4
+    # data of a day is final once processed, 24-48 hours after it ends
+    IMMUTABLE_AFTER = timedelta(days=3)
 
     def __init__(
         self, credential: GenericCredential, date_range, **kwargs
@@ -56,6 +122,10 @@ class GoogleUniversalFactory(ConnectorFactory):
         assert len(METRICS) <= 10
         self.METRICS = self.parse_ga_args(METRICS)
 
+        self.connector_id = credential.id
+        self.platform = credential.platform
+        self.company_id = credential.company_id
+
         self.token = credential.metadata["token"]
         self.scopes = credential.metadata["scopes"]
         self.client_id = credential.metadata["client_id"]
@@ -64,28 +134,234 @@ class GoogleUniversalFactory(ConnectorFactory):
         self.refresh_token = credential.metadata["refresh_token"]
         self.accounts = credential.metadata["accounts"]
 
-        self.date_range = date_range
+        self.configure(**kwargs)
+        self.date_range = self.coalesce(date_range)
+        # threads used to discover profiles and query reports, 1 is serial
+        self.workers = max(1, kwargs.get("workers", 1))
+        # rows: a dict per row, columnar: a typed array per column
+        self.output_format = kwargs.get("output_format", "rows")
+        if self.output_format not in self.OUTPUT_FORMATS:
+            raise ValueError(
+                f"output_format must be one of {self.OUTPUT_FORMATS}"
+            )
+        # v3: Core Reporting API, v4: Reporting API batchGet
+        self.engine = kwargs.get(
+            "engine", credential.metadata.get("engine", "v3")
+        )
+        if self.engine not in self.ENGINES:
+            raise ValueError(f"engine must be one of {self.ENGINES}")
         self.service = None
         self.profiles = []
-        self.set_up()
-        self.extract()
+        self._lock = threading.Lock()
+        self._profile_slots = defaultdict(
+            lambda: threading.BoundedSemaphore(self.PROFILE_CONCURRENCY)
+        )
+        if not self.deferred:
+            with self.timer("set_up"):
+                self.set_up()
+            self.extract()
 
     def set_up(self) -> None:
         """custom implementation here"""
         # Authenticate and construct service.
         self.accounts = [i["account"] for i in self.accounts]
-        self.service = self.build_service()
+        self.service = self.get_service()
         self.profiles = list(self.generate_profiles())
 
-    def extract(self) -> None:
-        """custom implementation here"""
-        for profile in self.profiles:
-            for date_range in self.date_range:
-                date_from, date_to = parse_date_range(date_range)
+    def extract(self) -> bool:
+        """custom implementation here
+        :return: bool if every page was delivered and no window failed
+        """
+        all_ok = True
+        for payload in self.stream():
+            if not self.deliver(payload) and payload.get("data"):
+                all_ok = False
+        return self.flush() and all_ok and not self.failed_windows
 
-                query = self.query_to_extract_data(profile, date_from, date_to)
-                for response in self.paginate_through(query):
-                    self.send(response)
+    def fetch_pages(self):
+        if self.adaptive is None:
+            jobs = [
+                (self.fetch_job, profile, date_range)
+                for profile in self.profiles
+                for date_range in self.date_range
+            ]
+        else:
+            jobs = [(self.fetch_planned, profile) for profile in self.profiles]
+
+        if self.workers == 1:
+            for function, *args in jobs:
+                yield from function(*args)
+            return
+
+        # results are yielded in job order, whatever finishes first.
+        # a window of jobs runs ahead of the consumer, each one holding
+        # at most JOB_PAGES pages in memory until they are consumed.
+        # the checkpoints of a job are written once the pages before
+        # them have been consumed
+        with ThreadPoolExecutor(self.workers) as pool:
+            pending = deque()
+            try:
+                for job in jobs:
+                    channel = PageChannel(self.JOB_PAGES)
+                    pool.submit(self._buffered_job, channel, *job)
+                    pending.append((job, channel))
+                    if len(pending) >= self.workers * 2:
+                        yield from self._drain_job(*pending.popleft())
+                while pending:
+                    yield from self._drain_job(*pending.popleft())
+            finally:
+                for _, channel in pending:
+                    channel.stop()
+
+    def fetch_job(self, profile: str, date_range):
+        """pages of a single profile and date range"""
+        state = self.load_checkpoint(profile, date_range) or {}
+        if state.get("done"):
+            logging.info(f"skipping {profile} {date_range}, already extracted")
+            return
+
+        date_from, date_to = parse_date_range(date_range)
+        start = self.resume_from(profile, date_from)
+        if start > date_to:
+            logging.info(f"skipping {profile} {date_range}, up to date")
+            return
+
+        query = self.query_to_extract_data(profile, start, date_to)
+        pages = partial(self.paginate_through, query, key=profile)
+        if state.get("cursor"):
+            logging.info(f"resuming {profile} from the last checkpoint")
+            query.uri = state["cursor"]
+            responses = pages()
+        else:
+            responses = self.cached_pages(
+                self.cache_query(profile, start, date_to), date_to, pages
+            )
+        try:
+            for response in responses:
+                yield self.build_payload(profile, response)
+                if response.get("nextLink"):
+                    self.save_checkpoint(
+                        profile, date_range, response["nextLink"]
+                    )
+        except (HttpError, RefreshError):
+            logging.error(f"giving up on {profile} {date_range} for this run")
+            self.window_failed()
+            return
+        self.complete_checkpoint(profile, date_range, date_to)
+
+    def fetch_planned(self, profile: str):
+        """pages of a profile with adaptive date windows, sized from the
+        totalResults of the previous windows. windows returning sampled
+        data are split before their pages are yielded. once a window is
+        given up the following ones are not completed, so the high-water
+        mark of the profile doesn't move past it"""
+        planner = self.plan(
+            self.date_range,
+            resolution=timedelta(days=1),
+            target_rows=self.MAX_RESULTS * 10,
+        )
+        gave_up = False
+        for window in planner:
+            state = self.load_checkpoint(profile, window) or {}
+            if state.get("done"):
+                logging.info(f"skipping {profile} {window}, already extracted")
+                continue
+            date_from, date_to = parse_date_range(window)
+            date_from = self.resume_from(profile, date_from)
+            if date_from > date_to:
+                continue
+
+            query = self.query_to_extract_data(profile, date_from, date_to)
+            if state.get("cursor"):
+                logging.info(f"resuming {profile} from the last checkpoint")
+                query.uri = state["cursor"]
+                pages = self.paginate_through(query, key=profile)
+            else:
+                pages = self.cached_pages(
+                    self.cache_query(profile, date_from, date_to),
+                    date_to,
+                    partial(self.paginate_through, query, key=profile),
+                )
+            try:
+                first = next(pages, None)
+                if first is None:
+                    planner.observe(0)
+                elif (
+                    first.get("containsSampledData")
+                    and not state.get("cursor")
+                    and planner.split()
+                ):
+                    logging.info(f"sampled data for {profile} {window}")
+                    pages.close()
+                    continue
+                else:
+                    planner.observe(first.get("totalResults", 0))
+                    for response in chain([first], pages):
+                        yield self.build_payload(profile, response)
+                        if response.get("nextLink"):
+                            self.save_checkpoint(
+                                profile, window, response["nextLink"]
+                            )
+            except (HttpError, RefreshError):
+                logging.error(f"giving up on {profile} {window} for this run")
+                self.window_failed()
+                gave_up = True
+                continue
+            if not gave_up:
+                self.complete_checkpoint(profile, window, date_to)
+
+    def cache_query(self, profile: str, date_from: DaTe, date_to: DaTe):
+        """what defines the responses of a query, see cached_pages"""
+        return {
+            "profile": profile,
+            "engine": self.engine,
+            "metrics": self.METRICS,
+            "dimensions": self.DIMENSIONS,
+            "window": [date_from, date_to],
+        }
+
+    def _buffered_job(
+        self, channel: PageChannel, function, profile: str, *args
+    ) -> None:
+        with self._lock:
+            slots = self._profile_slots[profile]
+        with slots:
+            channel.feed(deferred_checkpoints(function(profile, *args)))
+
+    def _drain_job(self, job: tuple, channel: PageChannel):
+        """pages of a job run by _buffered_job, writing its checkpoints
+        once the pages before them have been consumed"""
+        function, profile, *args = job
+        try:
+            for ops, page in channel:
+                write_checkpoints(ops)
+                if page is None:
+                    return
+                yield page
+        except (HttpError, RefreshError):
+            logging.error(f"giving up on {profile} {args} for this run")
+            self.window_failed()
+        finally:
+            channel.stop()
+
+    def build_payload(self, profile_id: str, response: dict) -> dict:
+        """Data Bridge payload for a page of the Core Reporting API"""
+        with self.timer("parse"):
+            if self.output_format == "columnar":
+                columns = self.parse_response_columnar(response)
+                data = {"columns": columns} if columns else ""
+            else:
+                rows = self.parse_response(response)
+                data = {"rows": rows} if rows else ""
+        payload = {
+            "source_name": self.platform,
+            "data": data,
+            "client_id": self.company_id,
+            "profile_id": profile_id,
+        }
+        if self.connector_id is not None:
+            payload.update({"internal_id": self.connector_id})
+        return payload
 
     @staticmethod
     def parse_ga_args(ga_args: Union[List[str], Tuple]) -> str:
@@ -98,17 +374,37 @@ class GoogleUniversalFactory(ConnectorFactory):
         Returns:
             generate each entity with data
         """
-        for id_ in self.accounts:
-            profile_ids = self._obtain_profiles(id_)
-            for profile in profile_ids:
+        if self.workers == 1:
+            results = map(self.obtain_profiles, self.accounts)
+        else:
+            with ThreadPoolExecutor(self.workers) as pool:
+                # map keeps the accounts order
+                results = list(pool.map(self.obtain_profiles, self.accounts))
+
+        for profile_ids in results:
+            for profile in profile_ids or []:
                 yield profile
 
-    def build_service(self):
-        """Get a service that communicates to a Google API.
-        Returns:
-            A service that is connected to the specified API.
+    def get_service(self, api: Optional[Tuple[str, str]] = None):
+        """service of the calling thread, taken from the process-wide pool
+        shared by every factory of the same client. googleapiclient
+        services are not thread-safe so every worker thread has its own
+        :param api: (name, version), the Core Reporting API by default
         """
-        credentials = Credentials(
+        api = api or (self.API_NAME, self.API_VERSION)
+        return get_service_pool().get(
+            self.pool_key(),
+            self.build_credentials,
+            partial(self.build_service, api=api),
+            self.refresh_credentials,
+            variant=api,
+        )
+
+    def pool_key(self) -> tuple:
+        return "google", self.client_id, self.refresh_token
+
+    def build_credentials(self) -> Credentials:
+        return SharedCredentials(
             token=self.token,
             refresh_token=self.refresh_token,
             id_token="",
@@ -117,14 +413,75 @@ class GoogleUniversalFactory(ConnectorFactory):
             client_secret=self.client_secret,
             scopes=self.scopes,
         )
-        # Build the service object.
-        service = build(
-            serviceName=self.API_NAME,
-            version=self.API_VERSION,
-            credentials=credentials,
+
+    @staticmethod
+    def refresh_credentials(credentials: Credentials) -> None:
+        credentials.refresh(Request())
+
+    def build_service(
+        self,
+        credentials: Optional[Credentials] = None,
+        api: Optional[Tuple[str, str]] = None,
+    ):
+        """Get a service that communicates to a Google API.
+        Args:
+            credentials: authorized credentials, new ones if not given
+            api: (name, version), the Core Reporting API by default
+        Returns:
+            A service that is connected to the specified API.
+        """
+        # Build the service object from the cached discovery document.
+        service = build_from_document(
+            self.discovery_document(api),
+            credentials=credentials or self.build_credentials(),
         )
         return service
 
+    @classmethod
+    def discovery_cache(cls) -> DiskCache:
+        return DiskCache("ga-discovery", ttl=cls.DISCOVERY_TTL)
+
+    @classmethod
+    def profiles_cache(cls) -> DiskCache:
+        return DiskCache("ga-profiles", ttl=cls.PROFILES_TTL)
+
+    @classmethod
+    def discovery_document(cls, api: Optional[Tuple[str, str]] = None):
+        """discovery document of the API, fetched once per DISCOVERY_TTL
+        :param api: (name, version), the Core Reporting API by default
+        """
+        name, version = api or (cls.API_NAME, cls.API_VERSION)
+
+        def fetch() -> dict:
+            url = cls.DISCOVERY_URL.format(api=name, version=version)
+            logging.info(f"fetching discovery document {url}")
+            response = requests.get(url, timeout=30)
+            response.raise_for_status()
+            return response.json()
+
+        key = f"{name}:{version}"
+        return cls.discovery_cache().get_or_set(key, fetch)
+
+    @classmethod
+    def invalidate_cache(
+        cls, account_id: Optional[str] = None, discovery: bool = False
+    ) -> None:
+        """drop the cached profiles of account_id (of every account if None)
+        and the discovery document if discovery is True"""
+        cls.profiles_cache().invalidate(account_id)
+        if discovery:
+            cls.discovery_cache().invalidate()
+
+    def obtain_profiles(self, account_id: str) -> Optional[List[str]]:
+        """self._obtain_profiles cached per account for PROFILES_TTL"""
+        cache = self.profiles_cache()
+        profiles = cache.get(account_id)
+        if profiles is None:
+            profiles = self._obtain_profiles(account_id)
+            if profiles is not None:
+                cache.set(account_id, profiles)
+        return profiles
+
     def _obtain_profiles(self, account_id: str) -> List[str]:
         """Use the Analytics service object to get all the profile ids
         based on the account_id.
@@ -136,11 +493,12 @@ class GoogleUniversalFactory(ConnectorFactory):
         try:
             # Get a list of all the properties for the account_id.
             query = (
-                self.service.management()
+                self.get_service()
+                .management()
                 .webproperties()
                 .list(accountId=account_id)
             )
-            response = query.execute()
+            response = self.call_api(query.execute, key=account_id)
 
             if not response.get("items"):
                 logging.warning("no Google Analytics profiles detected\n" * 5)
@@ -152,11 +510,12 @@ class GoogleUniversalFactory(ConnectorFactory):
 
                 # Get a list of all views (profiles) for the first property.
                 query = (
-                    self.service.management()
+                    self.get_service()
+                    .management()
                     .profiles()
                     .list(accountId=account_id, webPropertyId=property_)
                 )
-                response = query.execute()
+                response = self.call_api(query.execute, key=account_id)
         except TypeError as error:
             # Handle errors in constructing a query.
             logging.error(
@@ -164,18 +523,23 @@ class GoogleUniversalFactory(ConnectorFactory):
             )
             raise TypeError(error)
         except HttpError as error:
-            # Handle API errors.
+            # Handle API errors, retried by call_api until it gave up.
+            # the profiles of the account are missing from this run
             logging.error(
                 "Arg, there was an API error : {} : {}".format(
                     error.resp.status, error._get_reason()
                 )
             )
+            logging.error(f"giving up on account {account_id} for this run")
+            self.window_failed()
         except RefreshError:
             # Handle Auth errors.
             logging.error(
                 "The credentials have been revoked or expired, please re-run "
                 "the application to re-authorize"
             )
+            logging.error(f"giving up on account {account_id} for this run")
+            self.window_failed()
         except Exception as e:
             # Handle all other errors.
             raise Exception(e)
@@ -185,13 +549,15 @@ class GoogleUniversalFactory(ConnectorFactory):
             logging.warning("no Google Analytics profiles detected\n" * 5)
             return []
 
-    @staticmethod
-    def paginate_through(query):
-        """Get a service that communicates to a Google API.
+    def paginate_through(self, query, key: Optional[str] = None):
+        """Get all the pages of a query, retrying transient errors.
         Args:
             query: The constructed query to request from.
+            key: entity the retries are accounted to, e.g. the profile
         Returns:
             all contents paginating through query response.
+        Raises:
+            HttpError, RefreshError: once the retry policy gives up.
         """
         cursor = None
 
@@ -200,10 +566,7 @@ class GoogleUniversalFactory(ConnectorFactory):
             do_once = False
             # Try to make a request to the API. yield results or handle errors.
             try:
-                response = query.execute()
-                cursor = response.get("nextLink")
-                query.uri = cursor
-                yield response
+                response = self.call_api(query.execute, key=key)
             except HttpError as error:
                 # Handle API errors.
                 logging.error(
@@ -211,15 +574,18 @@ class GoogleUniversalFactory(ConnectorFactory):
                         error.resp.status, error._get_reason()
                     )
                 )
+                raise
             except RefreshError:
                 # Handle Auth errors.
                 logging.error(
                     "The credentials have been revoked or expired,"
                     "please re-run the application to re-authorize"
                 )
-            except Exception as e:
-                # Handle all other errors.
-                raise Exception(e)
+                get_service_pool().discard(self.pool_key())
+                raise
+            cursor = response.get("nextLink")
+            query.uri = cursor
+            yield response
 
     def query_to_extract_data(
         self, profile_id: str, date_from: DaTe, date_to: DaTe
@@ -232,9 +598,12 @@ class GoogleUniversalFactory(ConnectorFactory):
         Returns:
             constructed query.
         """
+        if self.engine == "v4":
+            return self.report_query(profile_id, date_from, date_to)
         try:
             query = (
-                self.service.data()
+                self.get_service()
+                .data()
                 .ga()
                 .get(
                     ids="ga:" + profile_id,
@@ -244,7 +613,7 @@ class GoogleUniversalFactory(ConnectorFactory):
                     dimensions=self.DIMENSIONS,
                     include_empty_rows=True,
                     start_index=1,
-                    max_results=1000,
+                    max_results=self.MAX_RESULTS,
                 )
             )
         except TypeError as error:
@@ -255,6 +624,28 @@ class GoogleUniversalFactory(ConnectorFactory):
             raise TypeError(error)
         return query
 
+    def report_query(
+        self, profile_id: str, date_from: DaTe, date_to: DaTe
+    ) -> "ReportQuery":
+        """same query as query_to_extract_data on the Reporting API v4,
+        pages of PAGE_SIZE rows instead of MAX_RESULTS"""
+        request = {
+            "viewId": profile_id,
+            "dateRanges": [
+                {
+                    "startDate": date_from.strftime(self.API_DATE_FORMAT),
+                    "endDate": date_to.strftime(self.API_DATE_FORMAT),
+                }
+            ],
+            "metrics": [
+                {"expression": i} for i in self.METRICS.split(",")
+            ],
+            "dimensions": [{"name": i} for i in self.DIMENSIONS.split(",")],
+            "includeEmptyRows": True,
+            "pageSize": self.PAGE_SIZE,
+        }
+        return ReportQuery(self.get_service(self.REPORTING_API), request)
+
     @staticmethod
     def _obtain_accounts(service) -> List[str]:
         """Get a list of all Google Analytics accounts for this user
@@ -265,7 +656,7 @@ class GoogleUniversalFactory(ConnectorFactory):
         """
         try:
             query = service.management().accounts().list()
-            response = query.execute()
+            response = get_policy().call(query.execute)
         except TypeError as error:
             # Handle errors in constructing a query.
             logging.error(
@@ -300,9 +691,8 @@ class GoogleUniversalFactory(ConnectorFactory):
 
     @staticmethod
     def parse_response(response: dict) -> Optional[List[dict]]:
-        if not response.get("columnHeaders") and response.get("rows"):
+        if not response.get("columnHeaders") or not response.get("rows"):
             return None
-        print(response["totalsForAllResults"])
         rows = response["rows"]
         column_headers = [i["name"] for i in response["columnHeaders"]]
 
@@ -311,6 +701,83 @@ class GoogleUniversalFactory(ConnectorFactory):
 
         return list(map(zip_a_row, rows))
 
-    def __del__(self):
-        if self.service:
-            self.service.close()
+    @classmethod
+    def parse_response_columnar(cls, response: dict) -> Optional[dict]:
+        """decode the rows of a response as one typed array per column,
+        numpy arrays if numpy is installed, array.array (or list for
+        strings) otherwise
+        Args:
+            response: Core Reporting API response
+        Returns:
+            {column name: values} or None if the response has no rows
+        """
+        if not response.get("columnHeaders") or not response.get("rows"):
+            return None
+
+        columns = {}
+        values = zip(*response["rows"])
+        for header, column in zip(response["columnHeaders"], values):
+            dtype, typecode, parser = cls.COLUMN_TYPES.get(
+                header.get("dataType"), (None, None, None)
+            )
+            if numpy is not None:
+                column = numpy.array(column, dtype=dtype or object)
+            elif typecode is not None:
+                column = array(typecode, map(parser, column))
+            else:
+                column = list(column)
+            columns[header["name"]] = column
+        return columns
+
+
+class ReportQuery:
+    """a Reporting API v4 batchGet that pages like a Core Reporting API
+    query, so both engines share pagination, checkpoints and parsing.
+
+    execute returns the report converted to a v3 response, the pageToken
+    of the next page is given as nextLink and read back from self.uri
+    """
+
+    def __init__(self, service, request: dict) -> None:
+        self.service = service
+        self.request = request
+        self.uri = None
+
+    def execute(self) -> dict:
+        request = dict(self.request)
+        if self.uri:
+            request["pageToken"] = self.uri
+        response = (
+            self.service.reports()
+            .batchGet(body={"reportRequests": [request]})
+            .execute()
+        )
+        return self.as_v3(response["reports"][0])
+
+    @staticmethod
+    def as_v3(report: dict) -> dict:
+        header = report.get("columnHeader", {})
+        metrics = header.get("metricHeader", {}).get("metricHeaderEntries")
+        column_headers = [
+            {"name": i, "columnType": "DIMENSION", "dataType": "STRING"}
+            for i in header.get("dimensions", [])
+        ] + [
+            {"name": i["name"], "columnType": "METRIC", "dataType": i["type"]}
+            for i in metrics or []
+        ]
+        data = report.get("data", {})
+        rows = [
+            row.get("dimensions", []) + row["metrics"][0]["values"]
+            for row in data.get("rows", [])
+        ]
+        response = {
+            "kind": "analytics#gaData",
+            "columnHeaders": column_headers,
+            "totalResults": data.get("rowCount", 0),
+            "containsSampledData": "samplesReadCounts" in data,
+        }
+        if rows:
+            response["rows"] = rows
+        if report.get("nextPageToken"):
+            response["nextLink"] = report["nextPageToken"]
+        return response
@@ -1,13 +1,102 @@
 import abc
-import json
-import os
+import threading
+import time
 import uuid
+from datetime import datetime
+from datetime import timedelta
+from functools import partial
+from typing import Callable
+from typing import Iterator
 from typing import NoReturn
+from typing import Optional
 import logging
-import requests
+
+from .cache import PageCache
+from .channel import PageChannel
+from .checkpoint import CheckpointStore
+from .delivery import BatchSender
+from .metrics import get_instrumentation
+from .planner import WindowPlanner
+from .planner import merge_date_ranges
+from .retry import RETRYABLE_STATUS
+from .retry import RetryPolicy
+from .retry import get_policy
+from .serialization import Encoded
+from .serialization import count_rows
+from .serialization import dumps
+from .session import get_session
+from .sinks import DataBridgeSink
+from .sinks import DedupSink
+from .sinks import PageDeduplicator
+from .sinks import Sink
+from .spool import ReplayWorker
+from .spool import get_spool
+
+# checkpoints taken by a prefetch thread, see ConnectorFactory.prefetched
+_deferred = threading.local()
+# failed_windows is counted from the worker threads of a factory too
+_failed_lock = threading.Lock()
+
+
+def checkpoint(write: Callable, *args) -> None:
+    """write a checkpoint, or hold it until the pages fetched before it
+    are delivered when called from a prefetch thread"""
+    ops = getattr(_deferred, "ops", None)
+    if ops is None:
+        write(*args)
+    else:
+        ops.append(partial(write, *args))
+
+
+def deferred_checkpoints(pages: Iterator) -> Iterator[tuple]:
+    """
+    runs pages holding the checkpoints they take, for pages run by a
+    thread other than the one delivering them
+    :return: iterator of (checkpoints taken before page, page), then
+        (checkpoints taken after the last page, None), to be written
+        with write_checkpoints by the delivering thread
+    """
+    _deferred.ops = []
+    try:
+        for page in pages:
+            ops, _deferred.ops = _deferred.ops, []
+            yield ops, page
+        yield _deferred.ops, None
+    finally:
+        _deferred.ops = None
+        close = getattr(pages, "close", None)
+        if close is not None:
+            close()
+
+
+def write_checkpoints(ops: list) -> None:
+    """write the checkpoints held by deferred_checkpoints, once the pages
+    before them have been delivered"""
+    for op in ops:
+        checkpoint(op)
 
 
 class ConnectorFactory(abc.ABC):
+    # windows ended longer ago than this can't change anymore and their
+    # pages may be served by the page cache, None: never cached
+    IMMUTABLE_AFTER: Optional[timedelta] = None
+
+    adaptive = None
+    batch_sender = None
+    checkpoints = None
+    coalesce_ranges = False
+    incremental = False
+    page_cache = None
+    prefetch = 0
+    retry_policy = None
+    sink = None
+    deferred = False
+    enabled = True
+    # windows given up during this run, see window_failed
+    failed_windows = 0
+    # the next page comes from the page cache, see cached_pages
+    serving_cache = False
+
     @classmethod
     def __subclasshook__(cls, subclass):
         return (
@@ -48,6 +137,400 @@ class ConnectorFactory(abc.ABC):
         """
         raise NotImplementedError
 
+    def fetch_pages(self) -> Iterator[dict]:
+        """
+        Gets the data from the connector api one page at a time,
+        every page is a payload ready for self.deliver
+        :return: iterator of payloads
+        """
+        raise NotImplementedError
+
+    def throttle(self) -> float:
+        """
+        seconds to wait before requesting the next page,
+        called once before every page request
+        :return: float
+        """
+        return 0
+
+    def paced_pages(self) -> Iterator[dict]:
+        """
+        self.fetch_pages waiting self.throttle() before each request,
+        pages served by the page cache are not paced, nothing is
+        requested when the factory is not enabled
+        :return: iterator of payloads
+        """
+        if not self.enabled:
+            return
+        pages = self.fetch_pages()
+        while True:
+            if not self.serving_cache:
+                with self.timer("wait"):
+                    time.sleep(self.throttle())
+            try:
+                page = next(pages)
+            except StopIteration:
+                return
+            self.count("rows", count_rows(page))
+            yield page
+
+    def tags(self) -> dict:
+        """connector and tenant of the metrics of this factory"""
+        return {
+            "connector": getattr(self, "platform", type(self).__name__),
+            "tenant": getattr(self, "company_id", None),
+        }
+
+    def timer(self, phase: str):
+        """context manager timing a phase, see metrics"""
+        return get_instrumentation().timer(phase, **self.tags())
+
+    def count(self, name: str, value: int = 1) -> None:
+        get_instrumentation().count(name, value, **self.tags())
+
+    def window_failed(self) -> None:
+        """counts a window given up for this run, so extract reports it"""
+        with _failed_lock:
+            self.failed_windows += 1
+        self.count("failed_windows")
+
+    def call_api(self, function, *args, key: Optional[str] = None, **kwargs):
+        """
+        calls the platform api through the retry policy, transient errors
+        are retried with backoff and the last one is raised. every
+        attempt is timed as fetch, apart from the parsing of the pages
+        :param key: entity the retry budget is accounted to, the tenant
+            if not given
+        """
+        policy = self.retry_policy or get_policy()
+        key = key or self.tags()["tenant"]
+
+        def fetch(*args, **kwargs):
+            with self.timer("fetch"):
+                return function(*args, **kwargs)
+
+        return policy.call(fetch, *args, key=key, tags=self.tags(), **kwargs)
+
+    def stream(self, records: bool = False) -> Iterator[dict]:
+        """
+        lazily yields the extracted data, only one page is held at a time
+        :param records: yield every record of the pages instead of
+            the pages themselves
+        :return: iterator of payloads, or of records
+        """
+        pages = self.paced_pages()
+        if self.prefetch:
+            pages = self.prefetched(pages)
+        for page in pages:
+            if records:
+                yield from self.page_records(page)
+            else:
+                yield page
+
+    def prefetched(self, pages: Iterator[dict]) -> Iterator[dict]:
+        """
+        pages consumed by a background thread up to self.prefetch pages
+        ahead of the caller, so the next requests overlap the delivery of
+        the current page. the pacing of paced_pages still applies.
+        checkpoints taken by the background thread are only written once
+        the caller comes back for the next page, after delivering the
+        pages before them
+        :param pages: iterator run by the background thread
+        :return: iterator of the same pages, in order
+        """
+        channel = PageChannel(self.prefetch)
+        thread = threading.Thread(
+            target=channel.feed,
+            args=(deferred_checkpoints(pages),),
+            name=f"prefetch-{self.tags()['tenant']}",
+        )
+        thread.daemon = True
+        thread.start()
+        try:
+            for ops, page in channel:
+                write_checkpoints(ops)
+                if page is None:
+                    return
+                yield page
+        finally:
+            channel.stop()
+            thread.join()
+
+    @staticmethod
+    def page_records(payload: dict) -> Iterator[dict]:
+        """records contained in the data section of a payload"""
+        data = payload.get("data")
+        if isinstance(data, dict) and isinstance(data.get("columns"), dict):
+            names = list(data["columns"])
+            for values in zip(*data["columns"].values()):
+                yield dict(zip(names, values))
+        elif isinstance(data, dict):
+            for value in data.values():
+                if isinstance(value, Encoded):
+                    yield from value.decode()
+                elif isinstance(value, list):
+                    yield from value
+        elif isinstance(data, list):
+            yield from data
+
+    def configure(self, **kwargs) -> None:
+        """
+        applies the optional keyword arguments given to the factory
+        :param kwargs:
+            batch: bool or dict with BatchSender arguments, enables the
+                batched and compressed Data Bridge delivery mode
+            deferred: bool, don't run set_up and extract on __init__,
+                used by the async engine
+            sink: Sink receiving the extracted pages, Data Bridge by default
+            checkpoints: CheckpointStore (or True for the default one),
+                interrupted date ranges resume from their last cursor
+                and finished ones are skipped
+            incremental: bool, with checkpoints, start every date range
+                at the high-water mark of the last successful run
+            adaptive: bool or dict with WindowPlanner arguments, replan
+                the date ranges in windows sized from the rows seen
+            prefetch: int, pages fetched ahead by a background thread
+                while the current one is delivered, 0 disables it
+            page_cache: PageCache (or True for the default one, or a dict
+                with its arguments), immutable windows are fetched once
+            retry: RetryPolicy or dict with its arguments, the shared
+                policy by default
+            dedup: bool, PageDeduplicator or dict with its arguments,
+                pages identical to one delivered recently are dropped
+            coalesce: bool, merge the overlapping date ranges given to
+                the factory, see self.coalesce
+        :return: None
+        """
+        self.deferred = kwargs.get("deferred", False)
+        # checkpoints waiting for the sink to flush, see _checkpoint
+        self._unflushed = []
+        batch = kwargs.get("batch")
+        if isinstance(batch, BatchSender):
+            self.batch_sender = batch
+        elif batch:
+            options = batch if isinstance(batch, dict) else {}
+            self.batch_sender = BatchSender(**options)
+
+        sink = kwargs.get("sink")
+        if sink is not None and not isinstance(sink, Sink):
+            raise TypeError(f"sink must be a {Sink}, not {type(sink)}")
+        self.sink = sink or DataBridgeSink(self.batch_sender)
+        dedup = kwargs.get("dedup")
+        if dedup:
+            if isinstance(dedup, dict):
+                dedup = PageDeduplicator(**dedup)
+            elif not isinstance(dedup, PageDeduplicator):
+                dedup = None  # the process-wide one
+            self.sink = DedupSink(self.sink, dedup)
+
+        checkpoints = kwargs.get("checkpoints")
+        if checkpoints is True:
+            checkpoints = CheckpointStore()
+        self.checkpoints = checkpoints or None
+        self.incremental = kwargs.get("incremental", False)
+        self.coalesce_ranges = kwargs.get("coalesce", False)
+
+        adaptive = kwargs.get("adaptive")
+        if adaptive:
+            self.adaptive = adaptive if isinstance(adaptive, dict) else {}
+        self.prefetch = max(0, int(kwargs.get("prefetch", 0)))
+
+        page_cache = kwargs.get("page_cache")
+        if page_cache is True:
+            page_cache = PageCache()
+        elif isinstance(page_cache, dict):
+            page_cache = PageCache(**page_cache)
+        self.page_cache = page_cache or None
+
+        retry = kwargs.get("retry")
+        if isinstance(retry, RetryPolicy):
+            self.retry_policy = retry
+        elif isinstance(retry, dict):
+            self.retry_policy = RetryPolicy(**retry)
+
+    def coalesce(self, date_range: list) -> list:
+        """
+        the caller's date ranges merged where they repeat or overlap,
+        as given unless configured with coalesce=True
+        """
+        if not self.coalesce_ranges:
+            return date_range
+        merged = merge_date_ranges(date_range)
+        if len(merged) != len(date_range):
+            logging.info(
+                f"{len(date_range)} date ranges coalesced in {len(merged)}"
+            )
+        return merged
+
+    def immutable(self, date_to: datetime) -> bool:
+        """if a window ending at date_to is past IMMUTABLE_AFTER"""
+        if self.IMMUTABLE_AFTER is None:
+            return False
+        return date_to < datetime.now(date_to.tzinfo) - self.IMMUTABLE_AFTER
+
+    def cached_pages(
+        self, query: dict, date_to: datetime, fetch: Callable[[], Iterator]
+    ) -> Iterator:
+        """
+        pages of fetch(), stored in self.page_cache and served from it
+        on the next runs when the window is immutable
+        :param query: everything defining the result besides the
+            connector, e.g. account, parameters and window
+        :param date_to: end of the window
+        :param fetch: function() -> iterator of json serializable pages
+        """
+        if self.page_cache is None or not self.immutable(date_to):
+            yield from fetch()
+            return
+
+        key = self.page_cache.key(connector=self.tags()["connector"], **query)
+        pages = self.page_cache.get(key)
+        if pages is not None:
+            self.count("cache_hits")
+            yield from self._unpaced(pages)
+            return
+        with self.page_cache.writer(key) as writer:
+            for page in fetch():
+                writer.append(page)
+                yield page
+
+    def _unpaced(self, pages: Iterator) -> Iterator:
+        """pages, telling paced_pages not to throttle the request of the
+        next one while it is a cached page too"""
+        done = object()
+        pages = iter(pages)
+        page = next(pages, done)
+        try:
+            while page is not done:
+                following = next(pages, done)
+                self.serving_cache = following is not done
+                yield page
+                page = following
+        finally:
+            self.serving_cache = False
+
+    def plan(self, date_range: list, **defaults) -> Optional[WindowPlanner]:
+        """
+        adaptive windows over date_range, None if not in adaptive mode
+        :param defaults: connector WindowPlanner arguments, overridden by
+            the ones given on configure
+        """
+        if self.adaptive is None:
+            return None
+        return WindowPlanner(date_range, **{**defaults, **self.adaptive})
+
+    def load_checkpoint(self, scope: str, window) -> Optional[dict]:
+        """
+        :param scope: entity extracted, e.g. store or profile
+        :param window: date range as given by the caller
+        :return: {cursor, high_water, done} or None
+        """
+        if self.checkpoints is None:
+            return None
+        return self.checkpoints.get(type(self).__name__, scope, window)
+
+    def save_checkpoint(self, scope: str, window, cursor: str) -> None:
+        """records the cursor of the next page, once the previous page
+        has been consumed"""
+        if self.checkpoints is not None:
+            checkpoint(
+                self._checkpoint,
+                partial(
+                    self.checkpoints.save_cursor,
+                    type(self).__name__,
+                    scope,
+                    window,
+                    cursor,
+                ),
+            )
+
+    def complete_checkpoint(self, scope: str, window, high_water) -> None:
+        """marks a window as extracted up to high_water (a datetime)"""
+        if self.checkpoints is not None:
+            checkpoint(
+                self._checkpoint,
+                partial(
+                    self.checkpoints.complete,
+                    type(self).__name__,
+                    scope,
+                    window,
+                    high_water.isoformat(),
+                ),
+            )
+
+    def _checkpoint(self, write: Callable[[], None]) -> None:
+        """write a checkpoint, held until the next successful flush when
+        the sink buffers the pages before it"""
+        if self.sink is not None and self.sink.buffers:
+            self._unflushed.append(write)
+        else:
+            write()
+
+    def resume_from(self, scope: str, date_from):
+        """
+        start of a window, moved to the last high-water mark of scope
+        in incremental mode
+        :param date_from: datetime
+        :return: datetime
+        """
+        if self.checkpoints is None or not self.incremental:
+            return date_from
+        high_water = self.checkpoints.high_water(type(self).__name__, scope)
+        if high_water is None:
+            return date_from
+        high_water = type(date_from).fromisoformat(high_water)
+        return max(date_from, high_water)
+
+    def deliver(self, payload: dict) -> bool:
+        """
+        writes the payload to self.sink, sent right away to Data Bridge
+        or buffered in batch mode by default
+        :param payload: same as self.send
+        :return: bool if everything is fine (queued, in batch mode)
+        """
+        with self.timer("send"):
+            return self.sink.write(payload)
+
+    def flush(self) -> bool:
+        """
+        pushes the payloads buffered by self.sink
+        :return: bool if every page was delivered, the checkpoints held
+            until then are written only in that case
+        """
+        flushed = self.sink.flush()
+        writes, self._unflushed = self._unflushed, []
+        if flushed:
+            for write in writes:
+                write()
+        elif writes:
+            logging.warning(
+                f"{len(writes)} checkpoints dropped, pages not delivered"
+            )
+        return flushed
+
+    @staticmethod
+    def dump(payload: dict, idempotency_key: Optional[str] = None) -> None:
+        """save a payload that could not be delivered in the
+        dead-letter spool, replayed later with replay_failed
+        :param idempotency_key: key of the attempts already made, reused
+            by the replays
+        """
+        get_spool().append(payload, idempotency_key)
+
+    @staticmethod
+    def replay_failed(interval: Optional[float] = None):
+        """
+        re-delivers the spooled payloads
+        :param interval: None to replay once, seconds between replays
+            for a background ReplayWorker
+        :return: payloads delivered, or the started ReplayWorker
+        """
+        if interval is None:
+            return get_spool().replay(ConnectorFactory.post)
+        worker = ReplayWorker(get_spool(), ConnectorFactory.post, interval)
+        worker.start()
+        return worker
+
     @staticmethod
     def send(payload: dict) -> bool:
         """
@@ -72,27 +555,61 @@ class ConnectorFactory(abc.ABC):
             )
             return not all_ok
 
-        logging.info(f"Requesting to {os.getenv('CM_URL')}")
-        request = requests.post(os.getenv("CM_URL"), json=payload)
-
-        if request.status_code != 200:
-            logging.error(f"Request error: {request.status_code}")
-            filename = str(uuid.uuid4())
-            logging.info(f"[-] filename: {filename}")
-            with open(f"{filename}.json", "w") as file_:
-                data = json.dumps(payload)
-                file_.write(data)
+        # the first attempt carries the key too, in case Data Bridge
+        # applied it but the response never came back
+        idempotency_key = str(uuid.uuid4())
+        if not ConnectorFactory.post(payload, idempotency_key):
+            ConnectorFactory.dump(payload, idempotency_key)
             return not all_ok
+        return all_ok
+
+    @staticmethod
+    def post(payload: dict, idempotency_key: Optional[str] = None) -> bool:
+        """
+        posts a payload to Data Bridge, without spooling it on failure
+        :param payload: same as self.send
+        :param idempotency_key: sent as Idempotency-Key header so retries
+            and replays of the same payload are only applied once, a new
+            one if not given
+        :return: bool if Data Bridge accepted it
+        """
+        session = get_session()
+        logging.info(f"Requesting to {session.url}")
+        headers = {
+            "Content-Type": "application/json",
+            "Idempotency-Key": idempotency_key or str(uuid.uuid4()),
+        }
+
+        metrics = get_instrumentation()
+        tags = {
+            "connector": payload.get("source_name"),
+            "tenant": payload.get("client_id"),
+        }
+        with metrics.timer("serialize", **tags):
+            body = dumps(payload)
+        metrics.count("bytes", len(body), **tags)
+
+        def attempt():
+            request = session.post(data=body, headers=headers)
+            if request.status_code in RETRYABLE_STATUS:
+                request.raise_for_status()
+            return request
+
+        try:
+            with metrics.timer("post", **tags):
+                request = get_policy().call(
+                    attempt, key=tags["tenant"], tags=tags
+                )
+            if request.status_code != 200:
+                logging.error(f"Request error: {request.status_code}")
+                return False
+            response = request.json()
+        except Exception as e:
+            logging.error(f"Request error: {e}")
+            return False
 
-        response = request.json()
         if response.get("status") != "Success":
             logging.error(f"Response error: {response}")
-            filename = str(uuid.uuid4())
-            logging.info(f"[-] filename: {filename}")
-            with open(f"{filename}.json", "w") as file_:
-                data = json.dumps(payload)
-                file_.write(data)
-            return not all_ok
-        else:
-            logging.info("Success response from Data Bridge")
-        return all_ok
+            return False
+        logging.info("Success response from Data Bridge")
+        return True
@@ -1,7 +1,51 @@
+from collections.abc import MutableMapping
 from functools import wraps
+from importlib import import_module
 from typing import Union
 
-_mapping = {}
+
+class LazyMapping(MutableMapping):
+    """alias-class relation where classes can be registered by module
+    name only, the module is imported on the first lookup of the alias
+    (and its mapping_alias decorator fills the real class)"""
+
+    def __init__(self) -> None:
+        self._classes = {}
+        self._modules = {}
+
+    def register(self, alias: str, module: str) -> None:
+        """declare the module defining alias, without importing it
+        :param module: "module" or "module:class" if the class is not
+            decorated with this alias"""
+        self._modules.setdefault(alias, module)
+
+    def __getitem__(self, alias: str):
+        if alias not in self._classes and alias in self._modules:
+            module, _, attribute = self._modules[alias].partition(":")
+            loaded = import_module(module)
+            if attribute and alias not in self._classes:
+                self._classes[alias] = getattr(loaded, attribute)
+        return self._classes[alias]
+
+    def __setitem__(self, alias: str, class_: object) -> None:
+        self._classes[alias] = class_
+
+    def __delitem__(self, alias: str) -> None:
+        self._classes.pop(alias, None)
+        self._modules.pop(alias, None)
+
+    def __contains__(self, alias) -> bool:
+        return alias in self._classes or alias in self._modules
+
+    def __iter__(self):
+        yield from self._classes
+        yield from (i for i in self._modules if i not in self._classes)
+
+    def __len__(self) -> int:
+        return len(set(self._classes) | set(self._modules))
+
+
+_mapping = LazyMapping()
 
 
 def mapping_alias(connector: Union[str, list]):
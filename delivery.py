@@ -0,0 +1,176 @@
+"""batched and compressed delivery mode for the Data Bridge middleware"""
+import logging
+import threading
+import uuid
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+from .metrics import get_instrumentation
+from .retry import RETRYABLE_STATUS
+from .retry import get_policy
+from .serialization import check_encoding
+from .serialization import compress
+from .serialization import count_rows
+from .serialization import dumps
+from .session import get_session
+
+
+class BatchSender:
+    """collects payloads per (client_id, source_name) and ships them
+    as a single compressed request once a threshold is reached.
+
+    the Data Bridge batch body is {"batch": [payload, ...]}, the response
+    may contain a "results" list with one {"status": ...} per payload,
+    otherwise the global "status" applies to every page of the batch.
+
+    a sender may be shared by several factories, the results of a page
+    are only returned by the flush of the owner that added it.
+    """
+
+    def __init__(
+        self,
+        max_rows: int = 10000,
+        max_bytes: int = 8 * 1024 * 1024,
+        encoding: str = "gzip",
+    ) -> None:
+        """
+        :param max_rows: records buffered per key before flushing
+        :param max_bytes: uncompressed bytes buffered per key before flushing
+        :param encoding: gzip, zstd or identity
+        """
+        check_encoding(encoding)
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.encoding = encoding
+        # owner -> (payload, delivered) of the pages shipped so far
+        self.results: Dict[Any, List[Tuple[dict, bool]]] = {}
+
+        self._lock = threading.Lock()
+        self._buffers: Dict[tuple, List[Tuple[dict, bytes, Any]]] = {}
+        self._sizes: Dict[tuple, List[int]] = {}
+
+    @staticmethod
+    def key(payload: dict) -> tuple:
+        return payload.get("client_id"), payload.get("source_name")
+
+    def add(self, payload: dict, owner: Any = None) -> bool:
+        """buffer a page, flushing its group if a threshold is reached
+        :param owner: whose flush reports the result of the page
+        :return: False if the page has no data, True otherwise
+        """
+        if not payload.get("data"):
+            logging.info(
+                "no orders for {}-{}".format(
+                    payload.get("client_id"), payload.get("source_name")
+                )
+            )
+            return False
+
+        key = self.key(payload)
+        client_id, source_name = key
+        metrics = get_instrumentation()
+        with metrics.timer(
+            "serialize", connector=source_name, tenant=client_id
+        ):
+            body = dumps(payload)
+        with self._lock:
+            self._buffers.setdefault(key, []).append((payload, body, owner))
+            rows, size = self._sizes.setdefault(key, [0, 0])
+            self._sizes[key] = [rows + count_rows(payload), size + len(body)]
+            rows, size = self._sizes[key]
+            if rows < self.max_rows and size < self.max_bytes:
+                return True
+            pages = self._pop(key)
+        self._ship(pages)
+        return True
+
+    def flush(self, owner: Any = None) -> List[Tuple[dict, bool]]:
+        """send every pending group
+        :param owner: as given to self.add
+        :return: (payload, delivered) for every page of owner shipped
+            since its last flush
+        """
+        with self._lock:
+            groups = [self._pop(key) for key in list(self._buffers)]
+        for pages in groups:
+            self._ship(pages)
+
+        with self._lock:
+            return self.results.pop(owner, [])
+
+    def _pop(self, key: tuple) -> List[Tuple[dict, bytes, Any]]:
+        self._sizes.pop(key, None)
+        return self._buffers.pop(key, [])
+
+    def _ship(self, pages: List[Tuple[dict, bytes, Any]]) -> None:
+        if not pages:
+            return
+        # pages are out of the buffers, every failure from here on must
+        # leave them marked as failed so they are dumped
+        statuses = [False] * len(pages)
+        try:
+            statuses = self._post(pages)
+        except Exception as e:
+            logging.error(f"Request error: {e!r}")
+
+        # imported here, connector_factory depends on this module
+        from .connector_factory import ConnectorFactory
+
+        with self._lock:
+            for (payload, _, owner), ok in zip(pages, statuses):
+                if not ok:
+                    ConnectorFactory.dump(payload)
+                self.results.setdefault(owner, []).append((payload, ok))
+        logging.info(
+            f"Data Bridge accepted {sum(statuses)} of {len(pages)} pages"
+        )
+
+    def _post(self, pages: List[Tuple[dict, bytes, Any]]) -> List[bool]:
+        """:return: if Data Bridge accepted each page"""
+        client_id, source_name = self.key(pages[0][0])
+        tags = {"connector": source_name, "tenant": client_id}
+        metrics = get_instrumentation()
+
+        body = b'{"batch":[' + b",".join(page for _, page, _ in pages) + b"]}"
+        raw_size = len(body)
+        with metrics.timer("compress", **tags):
+            body = compress(body, self.encoding)
+        metrics.count("bytes", len(body), **tags)
+
+        session = get_session()
+        logging.info(
+            f"Requesting to {session.url} with {len(pages)} pages "
+            f"({raw_size} -> {len(body)} bytes, {self.encoding})"
+        )
+        # every attempt of the batch carries the same key, so a retry of
+        # a batch already applied by Data Bridge is not applied twice
+        headers = {
+            "Content-Type": "application/json",
+            "Idempotency-Key": str(uuid.uuid4()),
+        }
+        if self.encoding != "identity":
+            headers["Content-Encoding"] = self.encoding
+
+        def attempt():
+            request = session.post(data=body, headers=headers)
+            if request.status_code in RETRYABLE_STATUS:
+                request.raise_for_status()
+            return request
+
+        with metrics.timer("post", **tags):
+            request = get_policy().call(attempt, key=client_id, tags=tags)
+        if request.status_code != 200:
+            logging.error(f"Request error: {request.status_code}")
+            return [False] * len(pages)
+        return self._statuses(request.json(), len(pages))
+
+    @staticmethod
+    def _statuses(response: dict, expected: int) -> List[bool]:
+        results = response.get("results")
+        if isinstance(results, list) and len(results) == expected:
+            return [r.get("status") == "Success" for r in results]
+        if response.get("status") != "Success":
+            logging.error(f"Response error: {response}")
+        return [response.get("status") == "Success"] * expected
@@ -1,3 +1,6 @@
+from functools import partial
+
+from .async_engine import AsyncConnector
 from .connector_factory import ConnectorFactory
 from .decorators import custom_base_mapping
 
@@ -6,9 +9,14 @@ from .decorators import custom_base_mapping
 @custom_base_mapping(var_name="_mapping")
 class FactoryManager:
     @classmethod
-    def get_factory(cls, alias: str) -> ConnectorFactory:
-        """obtain appropriate factory based on self.alias mapping"""
+    def get_factory(
+        cls, alias: str, asynchronous: bool = False
+    ) -> ConnectorFactory:
+        """obtain appropriate factory based on self.alias mapping,
+        an AsyncConnector builder if asynchronous is True"""
         concrete_factory = cls._mapping.get(alias)
         if not concrete_factory:
             raise NotImplementedError(f"handler not found for {cls}")
+        if asynchronous:
+            return partial(AsyncConnector, concrete_factory)
         return concrete_factory
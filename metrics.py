@@ -0,0 +1,182 @@
+"""latency and volume instrumentation of the connector hot paths.
+
+the instrumentation is process-wide, disabled (NullInstrumentation) until
+set_instrumentation is called, e.g.:
+    backend = HistogramBackend()
+    set_instrumentation(backend)
+    ...
+    backend.export(LoggingExporter())
+
+phases timed: set_up, fetch (one api call), parse, serialize, send, wait
+(throttle), counters: rows, bytes, retries, all tagged with connector
+and tenant (client_id)
+"""
+import abc
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+_instrumentation = None
+
+
+class Instrumentation(abc.ABC):
+    @abc.abstractmethod
+    def observe(self, name: str, value: float, **tags) -> None:
+        """record a value (seconds, bytes...) in the histogram of name"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def count(self, name: str, value: int = 1, **tags) -> None:
+        """add value to the counter of name"""
+        raise NotImplementedError
+
+    @contextmanager
+    def timer(self, phase: str, **tags):
+        """observe the seconds spent inside the block as phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.perf_counter() - start, **tags)
+
+
+class NullInstrumentation(Instrumentation):
+    def observe(self, name: str, value: float, **tags) -> None:
+        pass
+
+    def count(self, name: str, value: int = 1, **tags) -> None:
+        pass
+
+    @contextmanager
+    def timer(self, phase: str, **tags):
+        yield
+
+
+class Histogram:
+    """fixed exponential buckets, cheap to update and to merge"""
+
+    # 100us .. ~100s, doubling
+    BOUNDS = [0.0001 * 2 ** i for i in range(21)]
+
+    def __init__(self, bounds: List[float] = None) -> None:
+        self.bounds = bounds or self.BOUNDS
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def add(self, value: float) -> None:
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> float:
+        """upper bound of the bucket holding the q (0-100) percentile"""
+        if not self.count:
+            return 0.0
+        rank, seen = q / 100 * self.count, 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "min": self.min if self.count else 0.0,
+            "max": self.max if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+        }
+
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class HistogramBackend(Instrumentation):
+    """in-process, thread-safe histograms and counters"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.histograms: Dict[Key, Histogram] = {}
+        self.counters: Dict[Key, int] = {}
+
+    @staticmethod
+    def key(name: str, tags: dict) -> Key:
+        return name, tuple(sorted((k, str(v)) for k, v in tags.items()))
+
+    def observe(self, name: str, value: float, **tags) -> None:
+        key = self.key(name, tags)
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].add(value)
+
+    def count(self, name: str, value: int = 1, **tags) -> None:
+        key = self.key(name, tags)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def snapshot(self, reset: bool = False) -> dict:
+        """{"histograms": [...], "counters": [...]} of every series"""
+        with self._lock:
+            snapshot = {
+                "histograms": [
+                    {"name": name, "tags": dict(tags), **h.summary()}
+                    for (name, tags), h in self.histograms.items()
+                ],
+                "counters": [
+                    {"name": name, "tags": dict(tags), "value": value}
+                    for (name, tags), value in self.counters.items()
+                ],
+            }
+            if reset:
+                self.histograms, self.counters = {}, {}
+        return snapshot
+
+    def export(self, exporter: "Exporter", reset: bool = False) -> None:
+        exporter.export(self.snapshot(reset))
+
+
+class Exporter(abc.ABC):
+    @abc.abstractmethod
+    def export(self, snapshot: dict) -> None:
+        """push a HistogramBackend snapshot to a monitoring system"""
+        raise NotImplementedError
+
+
+class LoggingExporter(Exporter):
+    """writes one log line per series"""
+
+    def export(self, snapshot: dict) -> None:
+        for h in snapshot["histograms"]:
+            logging.info(
+                f"{h['name']} {h['tags']} count={h['count']} "
+                f"sum={h['sum']:.3f}s p50={h['p50']:.4f}s "
+                f"p90={h['p90']:.4f}s p99={h['p99']:.4f}s"
+            )
+        for c in snapshot["counters"]:
+            logging.info(f"{c['name']} {c['tags']} value={c['value']}")
+
+
+def get_instrumentation() -> Instrumentation:
+    global _instrumentation
+    if _instrumentation is None:
+        _instrumentation = NullInstrumentation()
+    return _instrumentation
+
+
+def set_instrumentation(instrumentation: Instrumentation) -> None:
+    global _instrumentation
+    _instrumentation = instrumentation
@@ -0,0 +1,130 @@
+"""adaptive date window planning on top of the caller's date ranges"""
+from collections import deque
+from datetime import timedelta
+from typing import Iterator
+from typing import List
+from typing import Tuple
+
+from ..core.utils import parse_date_range
+
+
+def merge_date_ranges(date_range: list) -> List[dict]:
+    """
+    the caller's ranges without repetitions nor overlaps, so no period is
+    downloaded twice. ranges that don't overlap any other are kept as
+    given, even if contiguous, and merged ones keep the "from"/"to"
+    strings of their ends.
+    """
+    ranges = sorted(
+        ((parse_date_range(i), i) for i in date_range), key=lambda r: r[0]
+    )
+    merged = []
+    for (start, end), original in ranges:
+        if merged and start <= merged[-1][1]:
+            first, last, group = merged[-1]
+            if end > last:
+                group = {"from": group["from"], "to": original["to"]}
+            merged[-1] = (first, max(end, last), group)
+        else:
+            merged.append((start, end, original))
+    return [group for _, _, group in merged]
+
+
+class WindowPlanner:
+    """splits the caller's date ranges in windows sized from the rows
+    seen so far: quiet periods are merged in wide windows (fewer calls),
+    busy ones are narrowed (no sampling, fewer pages per window).
+
+    usage:
+        planner = WindowPlanner(date_range, resolution=timedelta(days=1))
+        for window in planner:
+            ...  # fetch window {"from": iso, "to": iso}
+            planner.observe(rows)
+
+    a window that turns out to be too big (e.g. sampled data) can be
+    replanned as two halves with planner.split() before consuming it.
+    """
+
+    def __init__(
+        self,
+        date_range: list,
+        resolution: timedelta = timedelta(days=1),
+        target_rows: int = 5000,
+        min_size: timedelta = timedelta(days=1),
+        max_size: timedelta = timedelta(days=31),
+        initial_size: timedelta = None,
+    ) -> None:
+        """
+        :param date_range: the caller's ranges, parsed by parse_date_range
+        :param resolution: smallest step of the api, a day for GA,
+            a second for timestamp filters like Shopify's
+        :param target_rows: rows wanted per window
+        :param min_size: narrowest window
+        :param max_size: widest window
+        :param initial_size: size of the first window, min_size by default
+        """
+        self.resolution = resolution
+        self.target_rows = target_rows
+        self.min_size = max(min_size, resolution)
+        self.max_size = max(max_size, self.min_size)
+        self.size = self._round(initial_size or self.min_size)
+
+        self._pending = deque(self._spans(date_range))
+        self._current = None
+
+    def _spans(self, date_range: list) -> List[Tuple]:
+        """caller ranges sorted and joined when contiguous"""
+        spans = sorted(parse_date_range(i) for i in date_range)
+        joined = []
+        for start, end in spans:
+            if joined and start <= joined[-1][1] + self.resolution:
+                joined[-1] = (joined[-1][0], max(end, joined[-1][1]))
+            else:
+                joined.append((start, end))
+        return joined
+
+    def _round(self, size: timedelta) -> timedelta:
+        size = min(max(size, self.min_size), self.max_size)
+        return self.resolution * max(1, round(size / self.resolution))
+
+    def __iter__(self) -> Iterator[dict]:
+        while self._pending:
+            start, end = self._pending.popleft()
+            window_end = min(end, start + self.size - self.resolution)
+            if window_end < end:
+                self._pending.appendleft((window_end + self.resolution, end))
+            self._current = (start, window_end)
+            yield self.as_range(*self._current)
+
+    @staticmethod
+    def as_range(start, end) -> dict:
+        return {"from": start.isoformat(), "to": end.isoformat()}
+
+    def observe(self, rows: int) -> None:
+        """resize the next windows from the rows of the current one"""
+        if self._current is None:
+            return
+        start, end = self._current
+        span = end - start + self.resolution
+        if rows > self.target_rows:
+            self.size = self._round(span * self.target_rows / rows)
+        elif rows < self.target_rows / 4:
+            self.size = self._round(span * 2)
+
+    def split(self) -> bool:
+        """replan the current window as two halves, to be yielded next
+        :return: False if the window can't be narrowed any further
+        """
+        if self._current is None:
+            return False
+        start, end = self._current
+        span = end - start + self.resolution
+        if span < self.min_size * 2:
+            return False
+
+        middle = start + self._round(span / 2) - self.resolution
+        self._pending.appendleft((middle + self.resolution, end))
+        self._pending.appendleft((start, middle))
+        self.size = self._round(span / 2)
+        self._current = None
+        return True
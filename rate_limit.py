@@ -0,0 +1,78 @@
+"""leaky bucket rate limiter shared by every factory of the same api key"""
+import threading
+import time
+from typing import Dict
+from typing import Optional
+
+_lock = threading.Lock()
+_buckets: Dict[str, "LeakyBucket"] = {}
+
+
+class LeakyBucket:
+    """client side mirror of a leaky bucket api limit (e.g. Shopify REST:
+    40 calls bucket leaking 2 calls per second).
+
+    requests burst freely while budget remains and only wait when the
+    bucket is about to overflow. the level is corrected with the usage
+    reported by the api after each call, see self.update
+    """
+
+    def __init__(
+        self, capacity: int = 40, leak_rate: float = 2.0, margin: int = 2
+    ) -> None:
+        """
+        :param capacity: calls the bucket holds
+        :param leak_rate: calls per second freed by the api
+        :param margin: calls kept free for other processes on the same key
+        """
+        self.capacity = capacity
+        self.leak_rate = leak_rate
+        self.margin = margin
+        self.level = 0.0
+
+        self._lock = threading.Lock()
+        self._updated = time.monotonic()
+
+    def _leak(self) -> None:
+        now = time.monotonic()
+        elapsed, self._updated = now - self._updated, now
+        self.level = max(0.0, self.level - elapsed * self.leak_rate)
+
+    def reserve(self) -> float:
+        """take a slot for the next call
+        :return: seconds to wait before doing it
+        """
+        with self._lock:
+            self._leak()
+            limit = max(1, self.capacity - self.margin)
+            wait = max(0.0, (self.level + 1 - limit) / self.leak_rate)
+            self.level += 1
+            return wait
+
+    def update(self, used: int, capacity: Optional[int] = None) -> None:
+        """sync the bucket with the usage reported by the api"""
+        with self._lock:
+            self._leak()
+            if capacity:
+                self.capacity = capacity
+            self.level = float(used)
+
+    def update_from_header(self, value: Optional[str]) -> None:
+        """sync the bucket from a "used/capacity" header value,
+        e.g. X-Shopify-Shop-Api-Call-Limit: 32/40"""
+        if not value:
+            return
+        try:
+            used, capacity = (int(i) for i in value.split("/"))
+        except ValueError:
+            return
+        self.update(used, capacity)
+
+
+def get_bucket(key: str, **kwargs) -> LeakyBucket:
+    """obtain the bucket of an api key (store, account...),
+    kwargs are only used when the bucket is created"""
+    with _lock:
+        if key not in _buckets:
+            _buckets[key] = LeakyBucket(**kwargs)
+        return _buckets[key]
@@ -0,0 +1,179 @@
+"""retry policy shared by the api calls of the factories and by send.
+
+errors are classified without importing the api clients:
+    googleapiclient HttpError: error.resp.status + reason of error.content
+    pyactiveresource (Shopify) errors: error.response.code
+    requests errors: error.response.status_code, connection and timeouts
+https://developers.google.com/analytics/devguides/reporting/core/v3/errors
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable
+from typing import Dict
+from typing import Optional
+
+from .metrics import get_instrumentation
+
+# GA reasons worth retrying with backoff, any other 4xx is final
+RETRYABLE_REASONS = {
+    "rateLimitExceeded",
+    "userRateLimitExceeded",
+    "quotaExceeded",
+    "backendError",
+    "internalServerError",
+}
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {
+    "ConnectionError",
+    "ConnectTimeout",
+    "ReadTimeout",
+    "Timeout",
+}
+
+_lock = threading.Lock()
+_policy = None
+
+
+def error_status(error: Exception) -> Optional[int]:
+    resp = getattr(error, "resp", None)
+    if resp is not None and getattr(resp, "status", None) is not None:
+        return int(resp.status)
+    response = getattr(error, "response", None)
+    for attribute in ("status_code", "code", "status"):
+        value = getattr(response, attribute, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def error_reason(error: Exception) -> Optional[str]:
+    """first reason of a Google API error body"""
+    content = getattr(error, "content", None)
+    if not content:
+        return None
+    try:
+        body = json.loads(content)
+        return body["error"]["errors"][0]["reason"]
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    if type(error).__name__ in RETRYABLE_ERRORS or isinstance(
+        error, (ConnectionError, TimeoutError)
+    ):
+        return True
+    reason = error_reason(error)
+    if reason is not None:
+        return reason in RETRYABLE_REASONS
+    return error_status(error) in RETRYABLE_STATUS
+
+
+def retry_after(error: Exception) -> float:
+    """seconds asked by a Retry-After header, 0 if none"""
+    holders = getattr(error, "response", None), getattr(error, "resp", None)
+    for holder in holders:
+        headers = getattr(holder, "headers", holder)
+        if not hasattr(headers, "get"):
+            continue
+        value = headers.get("Retry-After") or headers.get("retry-after")
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            continue
+    return 0
+
+
+class RetryPolicy:
+    """jittered exponential backoff with a retry budget per key
+    (profile, store...), so a key failing over and over stops retrying
+    instead of eating the quota shared with every other tenant"""
+
+    def __init__(
+        self,
+        max_attempts: int = 5,
+        base: float = 1,
+        cap: float = 64,
+        budget: int = 50,
+        budget_window: float = 60 * 60,
+        classify: Callable[[Exception], bool] = is_retryable,
+    ) -> None:
+        """
+        :param max_attempts: calls made before giving up
+        :param base: seconds of the first backoff, doubled every retry
+        :param cap: max seconds of a backoff
+        :param budget: retries allowed per key within budget_window
+        :param budget_window: seconds
+        :param classify: function(error) -> bool if the call is retried
+        """
+        self.max_attempts = max_attempts
+        self.base = base
+        self.cap = cap
+        self.budget = budget
+        self.budget_window = budget_window
+        self.classify = classify
+
+        self._lock = threading.Lock()
+        self._spent: Dict[str, deque] = {}
+
+    def backoff(self, attempt: int) -> float:
+        """full jitter: uniform between 0 and the exponential delay"""
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+    def _spend(self, key: Optional[str]) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            spent = self._spent.setdefault(str(key), deque())
+            while spent and now - spent[0] > self.budget_window:
+                spent.popleft()
+            if len(spent) >= self.budget:
+                return False
+            spent.append(now)
+            return True
+
+    def call(
+        self,
+        function: Callable,
+        *args,
+        key: str = None,
+        tags: Optional[dict] = None,
+        **kwargs,
+    ):
+        """call function, retrying the errors classified as transient
+        :param key: entity the retry budget is accounted to
+        :param tags: connector and tenant the retries are counted to
+        :return: function result, the last error is raised on failure
+        """
+        attempt = 0
+        while True:
+            try:
+                return function(*args, **kwargs)
+            except Exception as error:
+                if (
+                    attempt + 1 >= self.max_attempts
+                    or not self.classify(error)
+                    or not self._spend(key)
+                ):
+                    raise
+                delay = max(self.backoff(attempt), retry_after(error))
+                logging.warning(
+                    f"retrying {key} in {delay:.1f}s "
+                    f"(attempt {attempt + 1}): {error!r}"
+                )
+                get_instrumentation().count("retries", **(tags or {}))
+                time.sleep(delay)
+                attempt += 1
+
+
+def get_policy() -> RetryPolicy:
+    """obtain the process-wide policy, created on first use"""
+    global _policy
+    if _policy is None:
+        with _lock:
+            if _policy is None:
+                _policy = RetryPolicy()
+    return _policy
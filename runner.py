@@ -0,0 +1,214 @@
+"""multi-tenant runner extracting a batch of credentials on one host"""
+import logging
+import os
+import signal
+import threading
+import time
+from collections import defaultdict
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import NamedTuple
+from typing import Optional
+
+from .manager import FactoryManager
+
+
+class Job(NamedTuple):
+    alias: str
+    credential: Any
+    date_range: list
+    options: dict = {}
+
+
+class JobResult(NamedTuple):
+    job: Job
+    ok: bool
+    error: Optional[str]
+    elapsed: float
+
+
+def run_job(job: Job) -> JobResult:
+    """extract a single credential, module level so process pools can
+    pickle it. the job is ok only if every window was extracted and
+    every page delivered"""
+    start = time.monotonic()
+    error = None
+    try:
+        factory_class = FactoryManager.get_factory(job.alias)
+        factory = factory_class(
+            job.credential, job.date_range, **{**job.options, "deferred": True}
+        )
+        if not factory.enabled:
+            error = "no credentials"
+        else:
+            with factory.timer("set_up"):
+                factory.set_up()
+            if not factory.extract():
+                error = "some windows or pages were not delivered"
+    except Exception as e:
+        error = repr(e)
+    if error is not None:
+        logging.error(f"job {job.alias} failed: {error}")
+    return JobResult(job, error is None, error, time.monotonic() - start)
+
+
+class Runner:
+    """runs jobs of every connector sharing the cores of the host.
+
+    I/O bound connectors run in a thread pool, connectors listed in
+    process_connectors (CPU heavy parsing) run in a process pool, their
+    credentials and options must be picklable.
+    at most connector_limits[alias] jobs of a connector run at once, the
+    others wait in a queue of their alias without taking a worker.
+
+    usage:
+        with Runner(max_workers=32, connector_limits={"shopify": 8}) as r:
+            for result in r.run(jobs):
+                ...
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        connector_limits: Optional[Dict[str, int]] = None,
+        processes: Optional[int] = None,
+        process_connectors: Iterable[str] = (),
+    ) -> None:
+        """
+        :param max_workers: jobs running at once, RUNNER_WORKERS
+            environment variable or 32 by default
+        :param connector_limits: max concurrent jobs per alias
+        :param processes: size of the process pool, cpu count by default
+        :param process_connectors: aliases run in the process pool
+        """
+        self.max_workers = max_workers or int(os.getenv("RUNNER_WORKERS", 32))
+        self.process_connectors = set(process_connectors)
+
+        self._limits = dict(connector_limits or {})
+        self._lock = threading.Lock()
+        self._running: Dict[str, int] = defaultdict(int)
+        self._waiting: Dict[str, deque] = defaultdict(deque)
+        self._stopping = threading.Event()
+        self._threads = ThreadPoolExecutor(
+            self.max_workers, thread_name_prefix="runner"
+        )
+        self._processes = None
+        if self.process_connectors:
+            self._processes = ProcessPoolExecutor(processes)
+
+    def submit(self, job: Job) -> Future:
+        """schedule a job, its future resolves to a JobResult"""
+        result = Future()
+        limit = self._limits.get(job.alias)
+        with self._lock:
+            if self._stopping.is_set():
+                result.set_result(JobResult(job, False, "cancelled", 0))
+                return result
+            if limit is not None:
+                if self._running[job.alias] >= limit:
+                    self._waiting[job.alias].append((job, result))
+                    return result
+                self._running[job.alias] += 1
+        self._start(job, result)
+        return result
+
+    def _start(self, job: Job, result: Future) -> None:
+        """hand job to the pool, its alias slot is already taken"""
+        try:
+            future = self._threads.submit(self._dispatch, job)
+        except RuntimeError:  # pool shut down meanwhile
+            result.set_result(JobResult(job, False, "cancelled", 0))
+            self._release(job.alias)
+            return
+        future.add_done_callback(
+            lambda future: self._finished(job, result, future)
+        )
+
+    def _finished(self, job: Job, result: Future, future: Future) -> None:
+        if future.cancelled():
+            result.set_result(JobResult(job, False, "cancelled", 0))
+        elif future.exception() is not None:
+            error = repr(future.exception())
+            result.set_result(JobResult(job, False, error, 0))
+        else:
+            result.set_result(future.result())
+        self._release(job.alias)
+
+    def _release(self, alias: str) -> None:
+        """start the next job waiting for the slot of alias, if any"""
+        if alias not in self._limits:
+            return
+        with self._lock:
+            waiting = self._waiting.get(alias)
+            if not waiting or self._stopping.is_set():
+                self._running[alias] -= 1
+                return
+            job, result = waiting.popleft()
+        self._start(job, result)
+
+    def run(self, jobs: Iterable[Job]) -> Iterator[JobResult]:
+        """run every job, results are yielded as they finish"""
+        futures = [self.submit(job) for job in jobs]
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            yield future.result()
+
+    def _dispatch(self, job: Job) -> JobResult:
+        if job.alias not in FactoryManager._mapping:
+            message = f"handler not found for {job.alias}"
+            return JobResult(job, False, message, 0)
+
+        if self._stopping.is_set():
+            return JobResult(job, False, "cancelled", 0)
+        if job.alias in self.process_connectors:
+            try:
+                future = self._processes.submit(run_job, job)
+            except RuntimeError:  # pool shut down meanwhile
+                return JobResult(job, False, "cancelled", 0)
+            return future.result()
+        return run_job(job)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """stop starting new jobs, the running ones are finished"""
+        with self._lock:
+            self._stopping.set()
+            waiting = [pair for queue in self._waiting.values()
+                       for pair in queue]
+            self._waiting.clear()
+        for job, result in waiting:
+            result.set_result(JobResult(job, False, "cancelled", 0))
+        self._threads.shutdown(wait=wait, cancel_futures=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=wait, cancel_futures=True)
+
+    def install_signal_handlers(self) -> None:
+        """graceful shutdown on SIGTERM and SIGINT, main thread only"""
+
+        def handler(signum, frame):
+            logging.warning(f"signal {signum} received, shutting down")
+            # the main thread may be holding self._lock in submit, the
+            # shutdown waits for it in another thread
+            self._stopping.set()
+            threading.Thread(
+                target=self.shutdown,
+                kwargs={"wait": False},
+                name="runner-shutdown",
+                daemon=True,
+            ).start()
+
+        signal.signal(signal.SIGTERM, handler)
+        signal.signal(signal.SIGINT, handler)
+
+    def __enter__(self) -> "Runner":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.shutdown()
@@ -0,0 +1,80 @@
+"""life cycle of the segment files shared by the dead-letter spool and
+the staging area.
+
+a segment is written as *{open}, renamed to *{sealed} once complete and
+claimed by the process consuming it with an atomic rename to
+*{sealed}{claimed}, so several processes can share a directory. the
+ones left open or claimed by a process that died are recovered after a
+grace period.
+"""
+import glob
+import logging
+import os
+import time
+from typing import Container
+from typing import Optional
+
+
+def seal(path: str, opened: str, sealed: str) -> str:
+    """
+    :param path: segment being written, ending in opened
+    :return: path of the sealed segment
+    """
+    sealed_path = path[: -len(opened)] + sealed
+    os.replace(path, sealed_path)
+    return sealed_path
+
+
+def claim(path: str, claimed: str) -> Optional[str]:
+    """
+    take a sealed segment
+    :return: path of the claimed segment, None if taken by another process
+    """
+    claimed_path = path + claimed
+    try:
+        os.replace(path, claimed_path)
+    except OSError:
+        return None
+    # renames keep the mtime, the grace period of recover starts now
+    os.utime(claimed_path)
+    return claimed_path
+
+
+def release(path: str, claimed: str) -> str:
+    """give back a claimed segment, consumed again later
+    :return: path of the sealed segment
+    """
+    sealed_path = path[: -len(claimed)]
+    os.replace(path, sealed_path)
+    return sealed_path
+
+
+def recover(
+    pattern: str,
+    opened: str,
+    sealed: str,
+    claimed: str,
+    writing: Container[str] = (),
+    grace: float = 60 * 60,
+) -> None:
+    """
+    seal the segments left open and release the ones left claimed by
+    processes that died, i.e. untouched for grace seconds
+    :param pattern: glob of the segments without suffix, e.g. dir/*
+    :param writing: segments open in this process, never sealed here
+    """
+    now = time.time()
+    for path in glob.glob(pattern + opened):
+        try:
+            if path not in writing and now - os.path.getmtime(path) > grace:
+                seal(path, opened, sealed)
+        except OSError:
+            continue
+
+    for path in glob.glob(pattern + claimed):
+        try:
+            if now - os.path.getmtime(path) > grace:
+                logging.warning(f"releasing {path}, abandoned by its owner")
+                release(path, claimed)
+        except OSError:
+            continue
@@ -0,0 +1,135 @@
+"""payload encoding helpers shared by the Data Bridge delivery paths"""
+import gzip
+import json
+from typing import Iterable
+from typing import Iterator
+
+try:
+    import orjson
+except ImportError:  # optional dependency, faster encoder
+    orjson = None
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+ENCODINGS = ("identity", "gzip", "zstd")
+
+
+def default(value):
+    """json fallback for typed columns (numpy arrays and scalars,
+    array.array)"""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class Encoded:
+    """list of records already serialized to json, spliced as is in
+    the payload body so records are encoded only once"""
+
+    __slots__ = ("body", "count")
+
+    def __init__(self, body: bytes, count: int) -> None:
+        self.body = body
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __bool__(self) -> bool:
+        return self.count > 0
+
+    def decode(self) -> list:
+        return json.loads(self.body)
+
+
+def _dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(
+            value, default=default, option=orjson.OPT_SERIALIZE_NUMPY
+        )
+    return json.dumps(value, separators=(",", ":"), default=default).encode(
+        "utf-8"
+    )
+
+
+def _has_encoded(value) -> bool:
+    if isinstance(value, Encoded):
+        return True
+    if isinstance(value, dict):
+        return any(_has_encoded(v) for v in value.values())
+    return False
+
+
+def encode_records(records: Iterable) -> Encoded:
+    """serialize records one by one, each one can be released as soon
+    as it has been encoded"""
+    chunks, count = [], 0
+    for record in records:
+        chunks.append(_dumps(record))
+        count += 1
+    return Encoded(b"[" + b",".join(chunks) + b"]", count)
+
+
+def iter_dumps(payload) -> Iterator[bytes]:
+    """serialize a payload to utf-8 json chunks, splicing Encoded values"""
+    if isinstance(payload, Encoded):
+        yield payload.body
+    elif isinstance(payload, dict) and _has_encoded(payload):
+        yield b"{"
+        for i, (key, value) in enumerate(payload.items()):
+            yield (b"," if i else b"") + _dumps(str(key)) + b":"
+            yield from iter_dumps(value)
+        yield b"}"
+    else:
+        yield _dumps(payload)
+
+
+def dumps(payload) -> bytes:
+    """serialize a payload to utf-8 json bytes, with orjson if installed"""
+    return b"".join(iter_dumps(payload))
+
+
+def loads(body):
+    """parse utf-8 json from bytes or a memoryview, with orjson if
+    installed (it reads memoryviews without copying them)"""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(bytes(body))
+
+
+def check_encoding(encoding: str) -> None:
+    """raises if encoding can't be used by compress"""
+    if encoding not in ENCODINGS:
+        raise ValueError(f"unknown encoding {encoding}, expected {ENCODINGS}")
+    if encoding == "zstd" and zstandard is None:
+        raise ImportError("zstd encoding requires the zstandard package")
+
+
+def compress(body: bytes, encoding: str = "gzip") -> bytes:
+    """compress an already serialized body
+    :param body: serialized payload
+    :param encoding: one of ENCODINGS, used as Content-Encoding header
+    :return: compressed body
+    """
+    check_encoding(encoding)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    return body
+
+
+def count_rows(payload: dict) -> int:
+    """number of records contained in a payload data section"""
+    data = payload.get("data")
+    if isinstance(data, dict):
+        if isinstance(data.get("columns"), dict):
+            return max(map(len, data["columns"].values()), default=0)
+        return sum(
+            len(v) for v in data.values() if isinstance(v, (list, Encoded))
+        )
+    if isinstance(data, list):
+        return len(data)
+    return 0
@@ -0,0 +1,168 @@
+"""process-wide pool of authorized api clients shared by the factories
+of the same client, so the token refresh and the client build are paid
+once per client instead of once per job"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from datetime import timedelta
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Hashable
+from typing import List
+from typing import Optional
+
+_lock = threading.Lock()
+_pool = None
+
+
+class _Entry:
+    __slots__ = ("credentials", "services", "lock")
+
+    def __init__(self, credentials) -> None:
+        self.credentials = credentials
+        # (thread ident, variant) -> (thread, service)
+        self.services: Dict[tuple, tuple] = {}
+        self.lock = threading.Lock()
+
+
+def close_service(service) -> None:
+    try:
+        service.close()
+    except Exception as e:
+        logging.warning(f"error closing {service}: {e}")
+
+
+class ServicePool:
+    """LRU pool of credentials and the services built on them.
+
+    the credentials of a key are shared by every thread and refreshed
+    before they expire, services (googleapiclient ones are not
+    thread-safe) are built once per key, variant and thread. the services of
+    finished threads are closed, the services of evicted keys are closed by
+    the thread that owns them, on its next call, as it may be using them.
+    """
+
+    def __init__(
+        self, max_size: int = 64, refresh_margin: float = 5 * 60
+    ) -> None:
+        """
+        :param max_size: keys kept before closing the least recently used
+        :param refresh_margin: seconds before the expiry of a token at
+            which it is refreshed
+        """
+        self.max_size = max_size
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        # services of evicted keys still owned by a live thread
+        self._retired: List[tuple] = []
+
+    def get(
+        self,
+        key: Hashable,
+        credentials: Callable[[], Any],
+        build: Callable[[Any], Any],
+        refresh: Optional[Callable[[Any], None]] = None,
+        variant: Hashable = None,
+    ):
+        """
+        service of key for the calling thread
+        :param credentials: function() -> credentials, called once per key
+        :param build: function(credentials) -> service
+        :param refresh: function(credentials) refreshing the token, only
+            called when credentials have an expiry close to now
+        :param variant: tells apart services built on the same
+            credentials, e.g. the api name and version
+        """
+        evicted = []
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(credentials())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                evicted.append(self._entries.popitem(last=False)[1])
+        self._retire(*evicted)
+
+        with entry.lock:
+            if refresh is not None and self.expiring(entry.credentials):
+                logging.info("refreshing token before it expires")
+                refresh(entry.credentials)
+            return self._thread_service(entry, build, variant)
+
+    def expiring(self, credentials) -> bool:
+        expiry = getattr(credentials, "expiry", None)
+        if expiry is None:  # unknown, the client refreshes it on 401
+            return False
+        return expiry - self.refresh_margin <= datetime.utcnow()
+
+    @staticmethod
+    def _thread_service(entry: _Entry, build: Callable, variant: Hashable):
+        ident = threading.get_ident()
+        current = threading.current_thread()
+        thread, service = entry.services.get((ident, variant), (None, None))
+        if thread is current:
+            return service
+        # ident reused by a new thread or first call of this thread
+        for other, (thread, old) in list(entry.services.items()):
+            if thread is not current and (
+                other[0] == ident or not thread.is_alive()
+            ):
+                close_service(old)
+                del entry.services[other]
+        service = build(entry.credentials)
+        entry.services[ident, variant] = (current, service)
+        return service
+
+    def _retire(self, *entries: _Entry) -> None:
+        """close the services of entries owned by the calling thread or
+        by finished threads, keep the others until their thread calls
+        again, then close every retired service it owns"""
+        current = threading.current_thread()
+        services = []
+        for entry in entries:
+            with entry.lock:
+                services.extend(entry.services.values())
+                entry.services.clear()
+
+        closing = []
+        with self._lock:
+            self._retired.extend(services)
+            retired, self._retired = self._retired, []
+            for thread, service in retired:
+                if thread is current or not thread.is_alive():
+                    closing.append(service)
+                else:
+                    self._retired.append((thread, service))
+        for service in closing:
+            close_service(service)
+
+    def discard(self, key: Hashable) -> None:
+        """close the services of key, e.g. after its token was revoked"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        self._retire(*[entry] if entry is not None else [])
+
+    def clear(self) -> None:
+        with self._lock:
+            entries, self._entries = self._entries, OrderedDict()
+        self._retire(*entries.values())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def get_service_pool() -> ServicePool:
+    """obtain the process-wide pool, sized by SERVICE_POOL_SIZE"""
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = ServicePool(
+                    max_size=int(os.getenv("SERVICE_POOL_SIZE", 64))
+                )
+    return _pool
@@ -0,0 +1,81 @@
+"""shared, pooled HTTP session used to talk with the Data Bridge middleware"""
+import logging
+import os
+import threading
+from typing import Optional
+from typing import Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_lock = threading.Lock()
+_session = None
+
+
+class DataBridgeSession:
+    """thread-safe keep-alive session for the Data Bridge endpoint.
+
+    a single instance is shared by every connector of the process, so
+    each page sent reuses an already open TCP/TLS connection from the pool
+    instead of paying the handshake again.
+
+    configuration is read once from the environment:
+        CM_URL: Data Bridge endpoint
+        CM_POOL_SIZE: max open connections kept alive (default 10)
+        CM_CONNECT_TIMEOUT: seconds to open a connection (default 5)
+        CM_READ_TIMEOUT: seconds to wait for a response (default 60)
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        pool_size: Optional[int] = None,
+        timeout: Optional[Tuple[float, float]] = None,
+    ) -> None:
+        self.url = url or os.getenv("CM_URL")
+        self.pool_size = pool_size or int(os.getenv("CM_POOL_SIZE", 10))
+        self.timeout = timeout or (
+            float(os.getenv("CM_CONNECT_TIMEOUT", 5)),
+            float(os.getenv("CM_READ_TIMEOUT", 60)),
+        )
+
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            pool_block=True,
+        )
+        self._session = requests.Session()
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers.update({"Connection": "keep-alive"})
+
+    def post(self, **kwargs) -> requests.Response:
+        """post to the Data Bridge endpoint using a pooled connection"""
+        kwargs.setdefault("timeout", self.timeout)
+        return self._session.post(self.url, **kwargs)
+
+    def close(self) -> None:
+        self._session.close()
+
+
+def get_session() -> DataBridgeSession:
+    """obtain the process-wide Data Bridge session, created on first use"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = DataBridgeSession()
+                logging.info(
+                    f"Data Bridge session to {_session.url} "
+                    f"(pool size: {_session.pool_size})"
+                )
+    return _session
+
+
+def reset_session() -> None:
+    """close the shared session, next get_session call opens a new one"""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _session = None
@@ -0,0 +1,177 @@
+"""destinations for the pages streamed by a connector"""
+import abc
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .delivery import BatchSender
+from .serialization import dumps
+
+_lock = threading.Lock()
+_deduplicator = None
+
+
+class Sink(abc.ABC):
+    # pages written are only delivered once flushed, checkpoints of the
+    # factory wait for a successful flush
+    buffers = False
+
+    @abc.abstractmethod
+    def write(self, payload: dict) -> bool:
+        """
+        :param payload: page streamed by ConnectorFactory.stream
+        :return: bool if everything is fine
+        """
+        raise NotImplementedError
+
+    def flush(self) -> bool:
+        """
+        pushes anything buffered by the sink
+        :return: bool if everything is fine
+        """
+        return True
+
+
+class DataBridgeSink(Sink):
+    """delivers every page to the Data Bridge middleware,
+    one request per page or buffered by a BatchSender"""
+
+    def __init__(self, batch_sender: BatchSender = None) -> None:
+        self.batch_sender = batch_sender
+        self.buffers = batch_sender is not None
+
+    def write(self, payload: dict) -> bool:
+        if self.batch_sender is not None:
+            return self.batch_sender.add(payload, owner=self)
+
+        # imported here, connector_factory depends on this module
+        from .connector_factory import ConnectorFactory
+
+        return ConnectorFactory.send(payload)
+
+    def flush(self) -> bool:
+        if self.batch_sender is None:
+            return True
+        return all(ok for _, ok in self.batch_sender.flush(owner=self))
+
+
+class FileSink(Sink):
+    """appends every page with data as a json line to a local file"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, payload: dict) -> bool:
+        if not payload.get("data"):
+            return False
+        line = dumps(payload)
+        with self._lock, open(self.path, "ab") as file_:
+            file_.write(line + b"\n")
+        return True
+
+
+class NullSink(Sink):
+    """discards every page, useful to measure or dry-run extractions"""
+
+    def write(self, payload: dict) -> bool:
+        if not payload.get("data"):
+            return False
+        logging.debug(
+            "discarded page for {}-{}".format(
+                payload.get("client_id"), payload.get("source_name")
+            )
+        )
+        return True
+
+
+class PageDeduplicator:
+    """remembers the content hash of the pages delivered recently, so
+    the same page downloaded twice (repeated or overlapping date ranges
+    of the scheduler) is only delivered once within ttl seconds"""
+
+    def __init__(self, ttl: float = 6 * 60 * 60, max_entries: int = 100000):
+        """
+        :param ttl: seconds a delivered page is remembered
+        :param max_entries: hashes kept before forgetting the oldest
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._seen: "OrderedDict[bytes, float]" = OrderedDict()
+
+    @staticmethod
+    def digest(payload: dict) -> bytes:
+        return hashlib.blake2b(dumps(payload), digest_size=16).digest()
+
+    def claim(self, digest: bytes) -> bool:
+        """
+        :return: False if the page was delivered within ttl, otherwise
+            it is remembered as delivered and True is returned
+        """
+        now = time.monotonic()
+        with self._lock:
+            while self._seen:
+                oldest, at = next(iter(self._seen.items()))
+                if now - at <= self.ttl and len(self._seen) < self.max_entries:
+                    break
+                del self._seen[oldest]
+            if digest in self._seen:
+                return False
+            self._seen[digest] = now
+            return True
+
+    def release(self, digest: bytes) -> None:
+        """forget a claimed page that could not be delivered"""
+        with self._lock:
+            self._seen.pop(digest, None)
+
+
+class DedupSink(Sink):
+    """drops the pages identical to one already written, the rest are
+    written to the wrapped sink"""
+
+    def __init__(
+        self, sink: Sink, deduplicator: PageDeduplicator = None
+    ) -> None:
+        self.sink = sink
+        self.deduplicator = deduplicator or get_deduplicator()
+        self.buffers = sink.buffers
+
+    def write(self, payload: dict) -> bool:
+        if not payload.get("data"):
+            return self.sink.write(payload)
+        digest = self.deduplicator.digest(payload)
+        if not self.deduplicator.claim(digest):
+            logging.info(
+                "duplicated page for {}-{}, skipped".format(
+                    payload.get("client_id"), payload.get("source_name")
+                )
+            )
+            return True
+        ok = False
+        try:
+            ok = self.sink.write(payload)
+        finally:
+            if not ok:
+                self.deduplicator.release(digest)
+        return ok
+
+    def flush(self) -> bool:
+        return self.sink.flush()
+
+
+def get_deduplicator() -> PageDeduplicator:
+    """obtain the process-wide deduplicator, remembering pages for
+    DEDUP_TTL seconds"""
+    global _deduplicator
+    if _deduplicator is None:
+        with _lock:
+            if _deduplicator is None:
+                _deduplicator = PageDeduplicator(
+                    ttl=float(os.getenv("DEDUP_TTL", 6 * 60 * 60))
+                )
+    return _deduplicator
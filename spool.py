@@ -0,0 +1,258 @@
+"""dead-letter spool for the payloads Data Bridge did not accept"""
+import glob
+import gzip
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Callable
+from typing import Iterator
+from typing import Optional
+
+from . import segments
+from .serialization import dumps
+
+_lock = threading.Lock()
+_spool = None
+
+
+class DeadLetterSpool:
+    """append-only segmented files of failed payloads.
+
+    every record is a json line {key, attempts, next_attempt, payload},
+    key is the idempotency key sent on every re-delivery.
+    segments are written as segment-*.open and renamed to
+    segment-*.jsonl[.gz] once rotated, only those sealed segments are
+    taken by self.replay, after being claimed with an atomic rename,
+    so several workers can share the same directory. sealed names carry
+    the earliest next_attempt of their records (segment-*.due-<epoch>),
+    segments not due yet are left untouched by self.replay.
+    """
+
+    OPEN, SEALED, CLAIMED = ".open", ".jsonl", ".replaying"
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        segment_bytes: int = 16 * 1024 * 1024,
+        compress: Optional[bool] = None,
+        max_attempts: int = 10,
+        backoff: float = 30,
+        max_backoff: float = 6 * 60 * 60,
+    ) -> None:
+        """
+        :param directory: CM_SPOOL_DIR environment variable or
+            ./dead_letter by default
+        :param segment_bytes: size a segment is rotated at
+        :param compress: gzip segments, CM_SPOOL_COMPRESS by default
+        :param max_attempts: re-deliveries before a record is parked in
+            the failed/ sub directory
+        :param backoff: seconds before the first re-delivery, doubled
+            (with jitter) on every attempt up to max_backoff
+        """
+        self.directory = directory or os.getenv("CM_SPOOL_DIR", "dead_letter")
+        self.segment_bytes = segment_bytes
+        if compress is None:
+            compress = os.getenv("CM_SPOOL_COMPRESS", "") == "1"
+        self.compress = compress
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self._segment = None
+        self._written = 0
+        self._due = None
+        os.makedirs(os.path.join(self.directory, "failed"), exist_ok=True)
+
+    @property
+    def suffix(self) -> str:
+        return self.SEALED + (".gz" if self.compress else "")
+
+    def _open(self, name: str, mode: str):
+        compressed = self.SEALED + ".gz" in name
+        if compressed or (self.compress and name.endswith(self.OPEN)):
+            return gzip.open(name, mode + "t", encoding="utf-8")
+        return open(name, mode, encoding="utf-8")
+
+    def append(
+        self, payload: dict, key: Optional[str] = None, attempts: int = 0
+    ) -> str:
+        """
+        spool a payload
+        :return: its idempotency key
+        """
+        record = {
+            "key": key or str(uuid.uuid4()),
+            "attempts": attempts,
+            "next_attempt": time.time() + self.delay(attempts),
+            "payload": payload,
+        }
+        line = dumps(record).decode("utf-8") + "\n"
+        with self._lock:
+            if self._segment is None:
+                self._segment = os.path.join(
+                    self.directory,
+                    f"segment-{time.time_ns()}-{os.getpid()}{self.OPEN}",
+                )
+                self._written = 0
+                self._due = record["next_attempt"]
+            with self._open(self._segment, "a") as file_:
+                file_.write(line)
+            self._written += len(line)
+            self._due = min(self._due, record["next_attempt"])
+            if self._written >= self.segment_bytes:
+                self._seal()
+        logging.info(f"[-] spooled {record['key']} in {self.directory}")
+        return record["key"]
+
+    def _seal(self, segment: Optional[str] = None) -> None:
+        segment = segment or self._segment
+        if segment is None:
+            return
+        if segment == self._segment:
+            due = f".due-{int(self._due)}"
+            segments.seal(segment, self.OPEN, due + self.suffix)
+            self._segment = None
+        else:  # left by a dead process, due unknown
+            segments.seal(segment, self.OPEN, self.suffix)
+
+    @staticmethod
+    def due(path: str) -> float:
+        """earliest next_attempt of the records of a sealed segment,
+        0 if unknown"""
+        match = re.search(r"\.due-(\d+)\.", os.path.basename(path))
+        return int(match.group(1)) if match else 0
+
+    def _recover(self, grace: float = 60 * 60) -> None:
+        """seal the segments left open by dead processes and release the
+        ones they claimed without finishing their replay"""
+        segments.recover(
+            os.path.join(self.directory, "segment-*"),
+            self.OPEN,
+            self.suffix,
+            self.CLAIMED,
+            writing=(self._segment,),
+            grace=grace,
+        )
+
+    def seal(self) -> None:
+        """close the segment being written, making it replayable"""
+        with self._lock:
+            self._seal()
+
+    def delay(self, attempts: int) -> float:
+        """seconds before re-delivery attempt number attempts + 1"""
+        if attempts == 0:
+            return 0
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1)
+
+    def _records(self, path: str) -> Iterator[dict]:
+        """records of a segment, a corrupted or truncated record, left by
+        a writer that died, is parked in failed/ and ends the segment"""
+        try:
+            with self._open(path, "r") as file_:
+                for line in file_:
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        logging.error(f"corrupted record in {path}, parked")
+                        self._park(path, line)
+                        return
+                    yield record
+        except (EOFError, OSError) as e:  # gzip cut short
+            logging.error(f"truncated segment {path}: {e!r}")
+
+    def _park(self, path: str, line: str) -> None:
+        name = os.path.basename(path) + ".corrupted"
+        with open(os.path.join(self.directory, "failed", name), "a") as file_:
+            file_.write(line.rstrip("\n") + "\n")
+
+    def replay(self, send: Callable[[dict, str], bool]) -> int:
+        """
+        re-deliver the due records of every sealed segment,
+        the rest are spooled again
+        :param send: function(payload, idempotency_key) -> delivered
+        :return: records delivered
+        """
+        self.seal()
+        with self._lock:
+            self._recover()
+
+        delivered = 0
+        pattern = os.path.join(self.directory, "segment-*" + self.SEALED)
+        sealed = glob.glob(pattern) + glob.glob(pattern + ".gz")
+        for path in sorted(sealed):
+            if self.due(path) > time.time():
+                continue  # nothing to re-deliver yet
+            claimed = segments.claim(path, self.CLAIMED)
+            if claimed is None:
+                continue  # taken by another worker
+
+            for record in self._records(claimed):
+                if record["next_attempt"] > time.time():
+                    self._keep(record, record["attempts"])
+                    continue
+                try:
+                    ok = send(record["payload"], record["key"])
+                except Exception as e:
+                    logging.error(f"replay of {record['key']} failed: {e!r}")
+                    ok = False
+                if ok:
+                    delivered += 1
+                else:
+                    self._keep(record, record["attempts"] + 1)
+            os.remove(claimed)
+        return delivered
+
+    def _keep(self, record: dict, attempts: int) -> None:
+        if attempts < self.max_attempts:
+            self.append(record["payload"], record["key"], attempts)
+            return
+        logging.error(f"giving up on {record['key']} after {attempts} tries")
+        path = os.path.join(self.directory, "failed", f"{record['key']}.json")
+        with open(path, "w") as file_:
+            json.dump(record, file_)
+
+
+class ReplayWorker(threading.Thread):
+    """background thread replaying a spool every interval seconds"""
+
+    def __init__(
+        self, spool: DeadLetterSpool, send: Callable, interval: float = 60
+    ) -> None:
+        super().__init__(name="dead-letter-replay", daemon=True)
+        self.spool = spool
+        self.send = send
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                delivered = self.spool.replay(self.send)
+                if delivered:
+                    logging.info(f"re-delivered {delivered} spooled payloads")
+            except Exception as e:
+                logging.error(f"dead-letter replay failed: {e}")
+            self._stop_event.wait(self.interval)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+def get_spool() -> DeadLetterSpool:
+    """obtain the process-wide spool, created on first use"""
+    global _spool
+    if _spool is None:
+        with _lock:
+            if _spool is None:
+                _spool = DeadLetterSpool()
+    return _spool
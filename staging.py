@@ -0,0 +1,270 @@
+"""on-disk staging of the extracted pages, so extraction and delivery
+can run as separate stages or processes and a run doesn't have to fit
+in memory"""
+import glob
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from typing import Dict
+from typing import Iterator
+from typing import Optional
+
+from . import segments
+from .serialization import dumps
+from .serialization import loads
+from .sinks import Sink
+
+_lock = threading.Lock()
+_staging = None
+
+MAGIC = b"CMSTAGE1"
+# every record: body length and crc32 of the body, then the body
+RECORD_HEADER = struct.Struct("<II")
+
+
+class CorruptedSegment(ValueError):
+    """a segment that is not a staging segment or fails its crc32"""
+
+
+class SegmentWriter:
+    """appends length-prefixed records to a segment file.
+
+    every record is flushed to the os once appended, so it survives the
+    death of the process, fsync=True also syncs the file to the disk on
+    close so it survives the host.
+    """
+
+    def __init__(self, path: str, fsync: bool = False) -> None:
+        self.path = path
+        self.fsync = fsync
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self.size = self._file.tell()
+
+    def append(self, body: bytes) -> None:
+        header = RECORD_HEADER.pack(len(body), zlib.crc32(body))
+        self._file.write(header + body)
+        self._file.flush()
+        self.size += RECORD_HEADER.size + len(body)
+
+    def close(self) -> None:
+        if self.fsync and not self._file.closed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._file.close()
+
+    def __enter__(self) -> "SegmentWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class SegmentReader:
+    """reads the records of a segment through mmap.
+
+    records are memoryviews of the mapping, nothing is copied. a view
+    is released once the next record is read, so it must be consumed
+    (or copied) before that. a truncated record at the end, left by a
+    writer that died, ends the segment.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = None
+        if size > len(MAGIC):
+            self._map = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+            if self._map[: len(MAGIC)] != MAGIC:
+                self.close()
+                raise CorruptedSegment(f"{path} is not a staging segment")
+
+    def __iter__(self) -> Iterator[memoryview]:
+        if self._map is None:
+            return
+        view = memoryview(self._map)
+        offset, end = len(MAGIC), len(self._map)
+        try:
+            while offset + RECORD_HEADER.size <= end:
+                length, crc = RECORD_HEADER.unpack_from(view, offset)
+                start = offset + RECORD_HEADER.size
+                if start + length > end:
+                    logging.warning(f"truncated record in {self.path}")
+                    return
+                record = view[start : start + length]
+                if zlib.crc32(record) != crc:
+                    record.release()
+                    raise CorruptedSegment(f"corrupted record in {self.path}")
+                yield record
+                record.release()
+                offset = start + length
+        finally:
+            view.release()
+
+    def payloads(self) -> Iterator[dict]:
+        for record in self:
+            yield loads(record)
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self) -> "SegmentReader":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class StagingArea:
+    """directory of append-only segments, one being written per
+    (source_name, client_id) at a time.
+
+    segments are written as *.open and renamed to *.seg once rotated
+    or sealed, only sealed segments are taken by self.drain, after being
+    claimed with an atomic rename, so several delivery processes can
+    share the same directory. see segments for their life cycle.
+    corrupted segments are moved to the quarantine/ sub directory.
+    """
+
+    OPEN, SEALED, CLAIMED = ".open", ".seg", ".delivering"
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        segment_bytes: int = 64 * 1024 * 1024,
+        fsync: bool = False,
+    ) -> None:
+        """
+        :param directory: CM_STAGING_DIR environment variable or
+            ./staging by default
+        :param segment_bytes: size a segment is rotated at
+        :param fsync: sync every segment to the disk when sealed
+        """
+        self.directory = directory or os.getenv("CM_STAGING_DIR", "staging")
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+
+        self._lock = threading.Lock()
+        self._writers: Dict[tuple, SegmentWriter] = {}
+        os.makedirs(os.path.join(self.directory, "quarantine"), exist_ok=True)
+
+    def _writer(self, key: tuple) -> SegmentWriter:
+        writer = self._writers.get(key)
+        if writer is None:
+            name = "-".join(re.sub(r"[^\w.]", "_", str(i)) for i in key)
+            path = os.path.join(
+                self.directory,
+                f"{name}-{time.time_ns()}-{os.getpid()}{self.OPEN}",
+            )
+            writer = self._writers[key] = SegmentWriter(path, self.fsync)
+        return writer
+
+    def append(self, payload: dict) -> None:
+        body = dumps(payload)
+        key = payload.get("source_name"), payload.get("client_id")
+        with self._lock:
+            writer = self._writer(key)
+            writer.append(body)
+            if writer.size >= self.segment_bytes:
+                self._seal(key)
+
+    def _seal(self, key: tuple) -> None:
+        writer = self._writers.pop(key, None)
+        if writer is not None:
+            writer.close()
+            segments.seal(writer.path, self.OPEN, self.SEALED)
+
+    def seal(self) -> None:
+        """close the segments being written, making them deliverable"""
+        with self._lock:
+            for key in list(self._writers):
+                self._seal(key)
+
+    def _recover(self, grace: float = 60 * 60) -> None:
+        """seal the segments left open by dead processes and release the
+        ones they claimed without finishing their delivery"""
+        segments.recover(
+            os.path.join(self.directory, "*"),
+            self.OPEN,
+            self.SEALED,
+            self.CLAIMED,
+            writing={writer.path for writer in self._writers.values()},
+            grace=grace,
+        )
+
+    def drain(self, sink: Sink) -> int:
+        """
+        write the pages of every sealed segment to sink, e.g. a
+        DataBridgeSink, and remove the segments
+        :return: pages written
+        """
+        with self._lock:
+            self._recover()
+
+        written = 0
+        pattern = os.path.join(self.directory, "*" + self.SEALED)
+        for path in sorted(glob.glob(pattern)):
+            claimed = segments.claim(path, self.CLAIMED)
+            if claimed is None:
+                continue  # taken by another process
+
+            try:
+                with SegmentReader(claimed) as reader:
+                    for payload in reader.payloads():
+                        sink.write(payload)
+                        written += 1
+                sink.flush()
+            except CorruptedSegment as e:
+                # the records before it were written, the rest is lost
+                logging.error(f"{e}, segment quarantined")
+                sink.flush()
+                self._quarantine(claimed)
+                continue
+            except Exception:
+                segments.release(claimed, self.CLAIMED)  # delivered again
+                raise
+            os.remove(claimed)
+        return written
+
+    def _quarantine(self, path: str) -> None:
+        name = os.path.basename(path)[: -len(self.CLAIMED)]
+        os.replace(path, os.path.join(self.directory, "quarantine", name))
+
+
+class StagingSink(Sink):
+    """stages every page on disk, delivered later by StagingArea.drain"""
+
+    def __init__(self, area: Optional[StagingArea] = None) -> None:
+        self.area = area or get_staging()
+
+    def write(self, payload: dict) -> bool:
+        if not payload.get("data"):
+            return False
+        self.area.append(payload)
+        return True
+
+    def flush(self) -> bool:
+        self.area.seal()
+        return True
+
+
+def get_staging() -> StagingArea:
+    """obtain the process-wide staging area, created on first use"""
+    global _staging
+    if _staging is None:
+        with _lock:
+            if _staging is None:
+                _staging = StagingArea()
+    return _staging